@@ -0,0 +1,132 @@
+# batch_evaluator.py
+import numpy as np
+
+import config
+from course_allocator import build_group_index
+from course_table import as_course_table
+from table import find_special_courses
+
+
+class BatchEvaluator:
+    """以 NumPy 一次評估一批候選分配
+
+    每個候選分配以 (老師, 課程) 的 0/1 矩陣表示，一批候選即為
+    (批次, 老師, 課程) 的陣列。節數與人次以矩陣乘法加總，備課組別
+    透過「課程 → 備課組別」關聯矩陣計算，verify_allocation、
+    verify_chinese_math 與同組衝堂等硬性規則也都在同一次呼叫中檢查。
+    """
+
+    def __init__(self, courses, teachers, periods_per_teacher=None):
+        table = as_course_table(courses)
+        self.table = table
+        self.teachers = list(teachers)
+        self.teacher_index = {t: k for k, t in enumerate(self.teachers)}
+        self.periods_per_teacher = periods_per_teacher or config.TEACHER_PERIODS
+
+        n_courses = len(table)
+        self.periods = np.asarray(table.periods, dtype=np.int32)
+        self.student_hours = np.asarray(table.student_hours, dtype=np.int32)
+
+        # 科目關聯矩陣：課程 → 社會、動作、學習、國語、數學
+        self.subjects = ["社會", "動作", "學習", "國語", "數學"]
+        self.subject_matrix = np.zeros((n_courses, len(self.subjects)), dtype=np.int32)
+        for s, subject in enumerate(self.subjects):
+            self.subject_matrix[table.ids_of(subject), s] = 1
+
+        # 備課組別關聯矩陣：特需課每堂一組，國數依 (科目, 年級) 合併
+        prep_keys = {}
+        rows, cols = [], []
+        for i in range(n_courses):
+            subject = table.subject_names[table.subject_codes[i]]
+            if subject in ("國語", "數學"):
+                key = (subject, table.grades[i])
+            else:
+                key = ("特需", i)
+            rows.append(i)
+            cols.append(prep_keys.setdefault(key, len(prep_keys)))
+        self.prep_matrix = np.zeros((n_courses, len(prep_keys)), dtype=np.int32)
+        self.prep_matrix[rows, cols] = 1
+
+        # 同組衝堂：每個 (組別, 科目) 為一格，同一組別內至多一格有課
+        main_ids = table.ids_of("國語", "數學")
+        cells = []
+        cell_group = []
+        for g, subjects in enumerate(build_group_index(table, main_ids)):
+            for ids in subjects.values():
+                cells.append(ids)
+                cell_group.append(g)
+        self.cell_matrix = np.zeros((n_courses, len(cells)), dtype=np.int32)
+        for k, ids in enumerate(cells):
+            self.cell_matrix[ids, k] = 1
+        n_groups = (max(cell_group) + 1) if cell_group else 0
+        self.cell_group_matrix = np.zeros((len(cells), n_groups), dtype=np.int32)
+        self.cell_group_matrix[np.arange(len(cells)), cell_group] = 1
+
+        # 特定 5 堂課必須分給不同老師
+        self.special_ids = [table.course_id(c) for c in find_special_courses(table)]
+
+    def encode(self, loads):
+        """將一組老師負載轉為 (老師, 課程) 的 0/1 矩陣"""
+        matrix = np.zeros((len(self.teachers), len(self.table)), dtype=np.int8)
+        for teacher, load in loads.items():
+            k = self.teacher_index[teacher]
+            for course in load["課程"]:
+                matrix[k, self.table.course_id(course)] = 1
+        return matrix
+
+    def encode_batch(self, candidates):
+        """將多組老師負載轉為 (批次, 老師, 課程) 陣列"""
+        return np.stack([self.encode(loads) for loads in candidates])
+
+    def from_teacher_indices(self, assignments):
+        """將 (批次, 課程) 的老師編號陣列轉為 (批次, 老師, 課程) 陣列"""
+        assignments = np.asarray(assignments)
+        teacher_ids = np.arange(len(self.teachers))
+        return (assignments[:, None, :] == teacher_ids[None, :, None]).astype(np.int8)
+
+    def evaluate(self, batch):
+        """評估一批候選分配，回傳各項指標與規則檢查結果（皆為以批次為第一維的陣列）"""
+        x = np.asarray(batch, dtype=np.int32)
+        if x.ndim == 2:
+            x = x[None]
+
+        periods = x @ self.periods
+        student_hours = x @ self.student_hours
+        prep_groups = ((x @ self.prep_matrix) > 0).sum(axis=-1)
+        counts = x @ self.subject_matrix
+        social, action, study, chinese, math = (counts[..., s] for s in range(len(self.subjects)))
+
+        hours_diff = student_hours.max(axis=1) - student_hours.min(axis=1)
+        groups_diff = prep_groups.max(axis=1) - prep_groups.min(axis=1)
+
+        # 每堂課恰好分給一位老師，每位老師節數等於規定節數
+        assigned_once = (x.sum(axis=1) == 1).all(axis=-1)
+        full_periods = (periods == self.periods_per_teacher).all(axis=-1)
+
+        # verify_allocation：社會課 1 或 2 堂；只有 1 堂者動作、學習課各 1 堂；學習課至多 1 堂
+        one_social_ok = (social != 1) | ((action == 1) & (study == 1))
+        basic_ok = (((social == 1) | (social == 2)) & one_social_ok & (study <= 1)).all(axis=-1)
+        special_ok = (x[..., self.special_ids].sum(axis=-1) <= 1).all(axis=-1)
+
+        # verify_chinese_math：每位老師至少一堂國語和一堂數學
+        chinese_math_ok = ((chinese > 0) & (math > 0)).all(axis=-1)
+
+        # 同年級同組別不同科目不能由同一人授課
+        occupied = ((x @ self.cell_matrix) > 0).astype(np.int32)
+        conflict_ok = ((occupied @ self.cell_group_matrix) <= 1).all(axis=(-2, -1))
+
+        valid = assigned_once & full_periods & basic_ok & special_ok & chinese_math_ok & conflict_ok
+        return {
+            "節數": periods,
+            "人次": student_hours,
+            "備課組別": prep_groups,
+            "hours_diff": hours_diff,
+            "groups_diff": groups_diff,
+            "assigned_once": assigned_once,
+            "full_periods": full_periods,
+            "basic_ok": basic_ok & special_ok,
+            "chinese_math_ok": chinese_math_ok,
+            "conflict_ok": conflict_ok,
+            "valid": valid,
+            "accepted": valid & (groups_diff <= config.MAX_GROUPS_SPREAD),
+        }
@@ -0,0 +1,441 @@
+# benchmark.py
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+from time import perf_counter
+
+import config
+from course_allocator import (allocate_courses, allocate_chinese_math, get_chinese_math_model,
+                              get_solver_backend, phase2_inputs, SolveCache, verify_chinese_math)
+from course_table import as_course_table
+from data_handler import save_to_csv, update_excel_with_solution
+import excel_loader
+from excel_loader import load_courses
+from fet_converter import convert_to_fet_format
+from search import search_best_solution, evaluate_solution
+from search_trace import SearchTracer
+from table import courses as table_courses, verify_allocation
+from teacher_load import as_teacher_load
+
+# --check 時批次評估檢查的候選分配數
+BATCH_CHECK_CANDIDATES = 3000
+
+
+def group_name(k):
+    """第 k 個組別名稱：A, B, ..., Z, AA, AB, ..."""
+    name = ""
+    k += 1
+    while k:
+        k, r = divmod(k - 1, 26)
+        name = chr(ord("A") + r) + name
+    return name
+
+
+def generate_courses(n_teachers=5, n_grades=6, groups_per_grade=2, subject_mix=None,
+                     quota=16, seed=0):
+    """產生可重現的合成課表
+
+    特需課沿用 table.courses 的 9 堂社會、5 堂動作與 2 堂學習（含 5 堂特定課程），
+    國語、數學課則依年級、組別與科目比例隨機產生，
+    總節數恰好等於 老師數 × 每人節數。
+    """
+    rng = random.Random(seed)
+    subject_mix = subject_mix or {"國語": 0.5, "數學": 0.5}
+    subjects = list(subject_mix)
+    weights = [subject_mix[s] for s in subjects]
+
+    generated = [dict(c) for c in table_courses if c["課程名稱"] in config.BASIC_SUBJECTS]
+    capacity = n_teachers * quota - sum(c["節數"] for c in generated)
+    if capacity <= 0:
+        raise ValueError("老師總節數不足以容納特需課程")
+
+    used = set()
+    group_count = groups_per_grade
+    while capacity > 0:
+        slots = [(grade, group_name(g), subject)
+                 for grade in range(1, n_grades + 1)
+                 for g in range(group_count)
+                 for subject in subjects
+                 if (grade, group_name(g), subject) not in used]
+        if not slots:
+            # 所有組別都已有課，再多開一組
+            group_count += 1
+            continue
+
+        grade, group, _ = rng.choice(slots)
+        subject = rng.choices(subjects, weights)[0]
+        if (grade, group, subject) in used:
+            continue
+        used.add((grade, group, subject))
+
+        periods = min(rng.choice((2, 4, 5, 6)), capacity)
+        students = rng.randint(2, 7)
+        generated.append({"年級": grade, "課程名稱": subject, "組別": group,
+                          "節數": periods, "人數": students, "人次": periods * students})
+        capacity -= periods
+
+    return generated
+
+
+def measure(func, repeat=1):
+    """執行 func repeat 次，回傳 (量測結果, 最後一次的回傳值)"""
+    tracemalloc.start()
+    start = perf_counter()
+    result = None
+    for _ in range(repeat):
+        result = func()
+    elapsed = perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "seconds": round(elapsed, 6),
+        "calls": repeat,
+        "per_call": round(elapsed / repeat, 6),
+        "peak_kib": round(peak / 1024, 1),
+    }, result
+
+
+def benchmark_size(n_teachers, n_grades, seed, repeat, search_attempts, output_dir, backends=()):
+    """對單一規模的合成課表量測各個階段"""
+    quota = config.TEACHER_PERIODS
+    generated = generate_courses(n_teachers, n_grades, quota=quota, seed=seed)
+    teacher_names = [f"{group_name(k)}老師" for k in range(n_teachers)]
+    size = {"teachers": n_teachers, "grades": n_grades, "courses": len(generated), "quota": quota}
+    results = []
+
+    def record(name, metrics, **extra):
+        entry = {"name": name, "size": size}
+        entry.update(metrics)
+        entry.update(extra)
+        results.append(entry)
+        print(f"  {name:<24} {metrics['per_call'] * 1000:10.2f} ms/call  "
+              f"peak {metrics['peak_kib']:10.1f} KiB")
+
+    # 第一階段：特需課程隨機分配
+    rng = random.Random(seed)
+    metrics, initial_loads = measure(lambda: allocate_courses(generated, teacher_names, rng), repeat)
+    record("allocate_courses", metrics)
+
+    # 第二階段：模型建立與每次求解分開量測
+    metrics, _ = measure(lambda: get_chinese_math_model(generated, teacher_names))
+    record("phase2_model_build", metrics)
+
+    phase1 = []
+    for k in range(repeat):
+        phase1.append(allocate_courses(generated, teacher_names, seed + k))
+    outcomes = Counter()
+
+    def solve_all():
+        for loads in phase1:
+            final_loads = allocate_chinese_math(loads, generated)
+            outcomes["feasible" if final_loads is not None else "infeasible"] += 1
+        return final_loads
+
+    metrics, _ = measure(solve_all)
+    metrics["calls"] = len(phase1)
+    metrics["per_call"] = round(metrics["seconds"] / len(phase1), 6)
+    record("allocate_chinese_math", metrics, outcomes=dict(outcomes))
+
+    # 各求解器後端的單次求解延遲（每個後端都從空的求解快取開始）
+    model = get_chinese_math_model(generated, teacher_names)
+    for name in backends:
+        try:
+            backend = get_solver_backend(name)
+        except (ValueError, RuntimeError) as e:
+            print(f"  略過求解器後端 {name}：{e}")
+            continue
+        model.solve_cache = SolveCache()
+        backend_outcomes = Counter()
+
+        def solve_with_backend():
+            for loads in phase1:
+                final_loads = allocate_chinese_math(loads, generated, backend=backend)
+                backend_outcomes["feasible" if final_loads is not None else "infeasible"] += 1
+
+        metrics, _ = measure(solve_with_backend)
+        metrics["calls"] = len(phase1)
+        metrics["per_call"] = round(metrics["seconds"] / len(phase1), 6)
+        record(f"phase2_solve[{name}]", metrics, backend=name, outcomes=dict(backend_outcomes))
+    model.solve_cache = SolveCache()
+
+    # 完整搜尋（種子與上面的第一階段錯開，避免直接命中求解快取）
+    stats = Counter()
+    tracer = SearchTracer()
+    metrics, solution = measure(lambda: search_best_solution(
+        search_attempts, workers=1, seed=seed + 1_000_003, stats=stats,
+        courses=generated, teachers=teacher_names, tracer=tracer))
+    quality = {}
+    if solution is not None:
+        hours_diff, groups_diff = evaluate_solution(solution)
+        quality = {"hours_diff": hours_diff, "groups_diff": groups_diff}
+    record("search", metrics, attempts_to_solution=stats["attempts"] if solution else None,
+           found=solution is not None, stats=dict(stats), trace=tracer.summary(), **quality)
+
+    # 匯出（沒有找到解時以第一階段的結果量測）
+    export_solution = solution if solution is not None else dict(initial_loads)
+    metrics, _ = measure(lambda: save_to_csv(export_solution, output_dir))
+    record("export_csv", metrics)
+    metrics, _ = measure(lambda: convert_to_fet_format(export_solution, output_dir, "fet"))
+    record("export_fet", metrics)
+    metrics, _ = measure(lambda: convert_to_fet_format(export_solution, output_dir, "csv"))
+    record("export_fet_csv", metrics)
+
+    import openpyxl
+    workbook_path = os.path.join(output_dir, f"source_{n_teachers}x{n_grades}.xlsx")
+    source = openpyxl.Workbook()
+    source.active.append(["年級", "課程名稱", "組別", "節數", "人數", "人次"])
+    for course in generated:
+        source.active.append([course["年級"], course["課程名稱"], course["組別"],
+                              course["節數"], course["人數"], course["人次"]])
+    source.save(workbook_path)
+
+    # 讀取課表：逐列解析與命中磁碟快取
+    metrics, _ = measure(lambda: load_courses(workbook_path, use_cache=False), repeat)
+    record("load_excel", metrics)
+    load_courses(workbook_path)
+    excel_loader._loaded.clear()
+    metrics, _ = measure(lambda: load_courses(workbook_path))
+    record("load_excel_cached", metrics)
+    for mode in ("copy", "separate", "patch"):
+        metrics, _ = measure(lambda: update_excel_with_solution(export_solution, workbook_path, mode))
+        record(f"export_excel_{mode}", metrics)
+
+    return results
+
+
+def solve_with_tradeoff(initial_loads, courses, groups_weight, backend=None):
+    """以指定的備課組差異權重（上限仍為 config.MAX_GROUPS_SPREAD）求解國數，無解時回傳 None"""
+    table = as_course_table(courses)
+    model = get_chinese_math_model(table, initial_loads.keys())
+    result = {t: as_teacher_load(load).copy() for t, load in initial_loads.items()}
+    model.update(*phase2_inputs(result, table, model))
+    model.set_tradeoff(groups_weight)
+    try:
+        assignment = model.solve(backend)
+    finally:
+        model.set_tradeoff()
+    if assignment is None:
+        return None
+    for t, assigned in assignment.items():
+        for i in assigned:
+            result[t].add(model.courses[i])
+    return result
+
+
+def check_hours_first(courses, teachers, seeds, backend=None):
+    """檢查預設目標在備課組差異上限內不會犧牲人次差異
+
+    對每個種子的第一階段結果，比較 allocate_chinese_math 的解與只最小化人次差異
+    （權重 0）的解：可行性必須相同、人次差異必須相同，且備課組差異不超過上限。
+    回傳不符合的 (種子, 預設解的差異, 只看人次的差異) 列表。
+    """
+    failures = []
+    for seed in seeds:
+        initial_loads = allocate_courses(courses, teachers, seed)
+        get_chinese_math_model(courses, teachers).solve_cache = SolveCache()
+        solution = allocate_chinese_math(initial_loads, courses, backend=backend)
+        reference = solve_with_tradeoff(initial_loads, courses, 0, backend)
+        found = evaluate_solution(solution) if solution is not None else None
+        expected = evaluate_solution(reference) if reference is not None else None
+        if (found is None) != (expected is None) or (found is not None and (
+                found[0] != expected[0] or found[1] > config.MAX_GROUPS_SPREAD)):
+            failures.append((seed, found, expected))
+    return failures
+
+
+def check_cp_backend(courses, teachers, seeds, reference):
+    """檢查 cp 後端與整數線性規劃後端（reference）的結果一致
+
+    對每個種子的第一階段結果，分別在不要求與要求每位老師都有國語和數學時，
+    以兩個後端求解（各自從空的求解快取開始）：可行性必須相同，
+    (人次差異, 備課組別差異) 也必須相同。
+    回傳 (不符合的 (種子, 是否要求國數, cp 的差異, reference 的差異) 列表, {後端: 總秒數})。
+    """
+    model = get_chinese_math_model(courses, teachers)
+    failures = []
+    seconds = Counter()
+    for seed in seeds:
+        initial_loads = allocate_courses(courses, teachers, seed)
+        for require_chinese_math in (False, True):
+            found = {}
+            for name in ("cp", reference):
+                model.solve_cache = SolveCache()
+                start = perf_counter()
+                solution = allocate_chinese_math(initial_loads, courses, require_chinese_math, backend=name)
+                seconds[name] += perf_counter() - start
+                found[name] = evaluate_solution(solution) if solution is not None else None
+            if found["cp"] != found[reference]:
+                failures.append((seed, require_chinese_math, found["cp"], found[reference]))
+    model.solve_cache = SolveCache()
+    return failures, seconds
+
+
+def random_candidates(courses, teachers, count, seed=0):
+    """以第一階段隨機分配加上隨機分給老師的國數課，產生 count 組完整的候選分配"""
+    table = as_course_table(courses)
+    main_ids = table.ids_of("國語", "數學")
+    rng = random.Random(seed)
+    candidates = []
+    for _ in range(count):
+        loads = allocate_courses(courses, teachers, rng)
+        for i in main_ids:
+            loads[rng.choice(teachers)].add(table[i])
+        candidates.append(loads)
+    return candidates
+
+
+def scalar_evaluate(loads, special_ids, table):
+    """以逐一檢查的方式評估一組候選分配，欄位與 BatchEvaluator.evaluate() 相同"""
+    hours_diff, groups_diff = evaluate_solution(loads)
+    special_ok = all(sum(table.course_id(c) in special_ids for c in load["課程"]) <= 1
+                     for load in loads.values())
+    return {
+        "hours_diff": hours_diff,
+        "groups_diff": groups_diff,
+        "full_periods": all(load["節數"] == config.TEACHER_PERIODS for load in loads.values()),
+        "basic_ok": verify_allocation(loads)[0] and special_ok,
+        "chinese_math_ok": verify_chinese_math(loads),
+    }
+
+
+def check_batch_evaluator(courses, teachers, count, seed=0):
+    """檢查 BatchEvaluator 與逐一檢查的結果一致，並量測兩者的耗時
+
+    回傳 (不一致的 (候選編號, 欄位, 逐一檢查的值, 批次的值) 列表, 逐一檢查秒數,
+    轉成矩陣的秒數, 批次評估秒數)。
+    """
+    from batch_evaluator import BatchEvaluator
+
+    candidates = random_candidates(courses, teachers, count, seed)
+    evaluator = BatchEvaluator(courses, teachers)
+    table = evaluator.table
+    special_ids = set(evaluator.special_ids)
+
+    start = perf_counter()
+    expected = [scalar_evaluate(loads, special_ids, table) for loads in candidates]
+    scalar_seconds = perf_counter() - start
+
+    start = perf_counter()
+    batch = evaluator.encode_batch(candidates)
+    encode_seconds = perf_counter() - start
+    start = perf_counter()
+    found = evaluator.evaluate(batch)
+    batch_seconds = perf_counter() - start
+
+    failures = []
+    for k, scores in enumerate(expected):
+        for name, value in scores.items():
+            if found[name][k] != value:
+                failures.append((k, name, value, found[name][k].item()))
+    return failures, scalar_seconds, encode_seconds, batch_seconds
+
+
+def run_checks(seeds, backend=None):
+    """在 table.courses 上執行正確性檢查，回傳是否全部通過
+
+    cp 後端與 backend（未指定或為 "cp" 時用 config.CP_FALLBACK_BACKEND）比較。
+    """
+    teachers = list(config.TEACHERS)
+    passed = True
+    failures = check_hours_first(table_courses, teachers, seeds, backend)
+    print(f"人次優先目標：{len(seeds) - len(failures)}/{len(seeds)} 個種子通過")
+    for seed, found, expected in failures:
+        print(f"  種子 {seed}：(人次差異, 備課組別差異) = {found}，只看人次時為 {expected}")
+    passed &= not failures
+
+    reference = backend if backend not in (None, "cp") else config.CP_FALLBACK_BACKEND
+    failures, seconds = check_cp_backend(table_courses, teachers, seeds, reference)
+    total = 2 * len(seeds)
+    print(f"cp 與 {reference} 後端一致：{total - len(failures)}/{total} 次求解通過"
+          f"（cp {seconds['cp']:.2f} 秒，{reference} {seconds[reference]:.2f} 秒）")
+    for seed, require_chinese_math, found, expected in failures:
+        print(f"  種子 {seed}{'（要求國數）' if require_chinese_math else ''}：cp 為 {found}，{reference} 為 {expected}")
+    passed &= not failures
+
+    try:
+        failures, scalar_seconds, encode_seconds, batch_seconds = check_batch_evaluator(
+            table_courses, teachers, BATCH_CHECK_CANDIDATES, seeds[0] if seeds else 0)
+    except ImportError as e:
+        print(f"略過批次評估檢查：{e}")
+    else:
+        print(f"批次評估與逐一檢查一致：{BATCH_CHECK_CANDIDATES - len({k for k, *_ in failures})}"
+              f"/{BATCH_CHECK_CANDIDATES} 組候選通過（逐一檢查 {scalar_seconds:.3f} 秒，"
+              f"批次評估 {batch_seconds:.3f} 秒，另需轉成矩陣 {encode_seconds:.3f} 秒）")
+        for k, name, expected, found in failures[:10]:
+            print(f"  候選 {k} 的 {name}：逐一檢查為 {expected}，批次為 {found}")
+        passed &= not failures
+    return passed
+
+
+def parse_sizes(text):
+    """解析 "5x6,10x12" 形式的規模設定（老師數 x 年級數）"""
+    sizes = []
+    for item in text.split(","):
+        n_teachers, n_grades = item.lower().split("x")
+        sizes.append((int(n_teachers), int(n_grades)))
+    return sizes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="排課流程效能基準測試")
+    parser.add_argument("--sizes", default="5x6,8x8,10x12",
+                        help="以逗號分隔的 老師數x年級數，例如 5x6,10x12")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="每個階段重複的次數")
+    parser.add_argument("--search-attempts", type=int, default=20, help="完整搜尋的最多嘗試次數")
+    parser.add_argument("--quota", type=int, default=None, help="每位老師的總節數（預設為 config.TEACHER_PERIODS）")
+    parser.add_argument("--backends", default="cbc,highs",
+                        help="要比較單次求解延遲的求解器後端，以逗號分隔（空字串表示不比較）")
+    parser.add_argument("--output", default=None, help="JSON 結果檔路徑")
+    parser.add_argument("--check", type=int, default=None, metavar="N",
+                        help="不量測效能，改在 table.courses 的前 N 個種子上執行正確性檢查")
+    args = parser.parse_args(argv)
+    if args.quota is not None:
+        config.TEACHER_PERIODS = args.quota
+    if args.check is not None:
+        return run_checks(range(args.seed, args.seed + args.check))
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    output = args.output or os.path.join(config.OUTPUT_PATH, f"benchmark_{timestamp}.json")
+
+    backends = [name for name in args.backends.split(",") if name]
+    results = []
+    with tempfile.TemporaryDirectory() as output_dir:
+        # 暫存的課表快取不寫進正式的快取資料夾
+        config.CACHE_PATH = os.path.join(output_dir, "cache")
+        for n_teachers, n_grades in parse_sizes(args.sizes):
+            print(f"\n規模：{n_teachers} 位老師、{n_grades} 個年級")
+            results.extend(benchmark_size(n_teachers, n_grades, args.seed, args.repeat,
+                                          args.search_attempts, output_dir, backends))
+
+    report = {
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "seed": args.seed,
+        "settings": {
+            "solver_mode": config.SOLVER_MODE,
+            "solver_backend": config.SOLVER_BACKEND,
+            "teacher_periods": config.TEACHER_PERIODS,
+            "enforce_chinese_math_in_solver": config.ENFORCE_CHINESE_MATH_IN_SOLVER,
+        },
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n基準測試結果已保存至 {output}")
+    return report
+
+
+if __name__ == "__main__":
+    outcome = main()
+    if outcome is False:
+        sys.exit(1)
@@ -0,0 +1,208 @@
+# candidate_store.py
+import argparse
+import hashlib
+import json
+import sqlite3
+from datetime import datetime
+
+import config
+from course_table import as_course_table
+from teacher_load import TeacherLoad, as_teacher_load
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    started_at TEXT NOT NULL,
+    mode TEXT,
+    base_seed INTEGER,
+    course_signature TEXT NOT NULL,
+    teachers TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS candidates (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    attempt INTEGER,
+    seed INTEGER,
+    hours_diff INTEGER NOT NULL,
+    groups_diff INTEGER NOT NULL,
+    periods TEXT NOT NULL,
+    student_hours TEXT NOT NULL,
+    assignment BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS candidates_quality ON candidates (groups_diff, hours_diff);
+CREATE INDEX IF NOT EXISTS candidates_hours ON candidates (hours_diff, groups_diff);
+CREATE INDEX IF NOT EXISTS candidates_run ON candidates (run_id);
+"""
+
+
+def course_key(course):
+    return course["課程名稱"], course["年級"], course["組別"]
+
+
+def course_signature(courses):
+    """課表內容的雜湊，用來確認儲存的分配對應同一份課表"""
+    table = as_course_table(courses)
+    text = json.dumps([[c["年級"], c["課程名稱"], c["組別"], c["節數"], c["人數"]] for c in table],
+                      ensure_ascii=False)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class CandidateStore:
+    """以 SQLite 保存搜尋過程中評估過的每個分配
+
+    每個分配以「課表中每堂課的老師編號」壓縮成 bytes，連同人次差異、備課組別差異、
+    各老師的節數與人次以及產生它的種子一起保存。add() 只放進緩衝區，
+    累積 batch_size 筆後才在一個交易中批次寫入；物件可序列化給平行工作行程，
+    連線會在各行程中重新建立。
+    """
+
+    def __init__(self, path=None, batch_size=None):
+        self.path = path or config.CANDIDATE_DB_PATH
+        self.batch_size = batch_size or config.CANDIDATE_BATCH_SIZE
+        self.run_id = None
+        self.teachers = None
+        self.table = None
+        self._key_ids = {}
+        self._buffer = []
+        self._connection = None
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, timeout=30)
+            self._connection.executescript(SCHEMA)
+        return self._connection
+
+    def start_run(self, courses, teachers, mode=None, base_seed=None, run_id=None):
+        """建立一次搜尋的紀錄，之後 add() 的分配都屬於這次搜尋
+
+        傳入 run_id 時（例如從檢查點接續的搜尋）沿用既有的紀錄。
+        """
+        self.table = as_course_table(courses)
+        self.teachers = list(teachers)
+        self._key_ids = {}
+        for course_id, course in enumerate(self.table):
+            self._key_ids.setdefault(course_key(course), []).append(course_id)
+        if run_id is not None:
+            self.run_id = run_id
+            return run_id
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT INTO runs (started_at, mode, base_seed, course_signature, teachers) VALUES (?, ?, ?, ?, ?)",
+                (datetime.now().isoformat(timespec="seconds"), mode, base_seed,
+                 course_signature(self.table), json.dumps(self.teachers, ensure_ascii=False)))
+        self.run_id = cursor.lastrowid
+        return self.run_id
+
+    def encode(self, loads):
+        """將分配壓縮成每堂課的老師編號（bytes，255 表示未分配）"""
+        assignment = bytearray([255]) * len(self.table)
+        for k, teacher in enumerate(self.teachers):
+            for course in loads[teacher]["課程"]:
+                course_id = self.table.course_id(course)
+                if course_id is None:
+                    # 平行工作行程中的課程是序列化後的複本，改以 (科目, 年級, 組別) 查找尚未分配的課
+                    course_id = next(i for i in self._key_ids[course_key(course)] if assignment[i] == 255)
+                assignment[course_id] = k
+        return bytes(assignment)
+
+    def add(self, loads, hours_diff, groups_diff, attempt=None, seed=None):
+        """記錄一個分配（先放進緩衝區）"""
+        self._buffer.append((
+            self.run_id, attempt, seed, hours_diff, groups_diff,
+            json.dumps([loads[t]["節數"] for t in self.teachers]),
+            json.dumps([loads[t]["人次"] for t in self.teachers]),
+            self.encode(loads),
+        ))
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """在一個交易中寫入緩衝區內的所有分配"""
+        if not self._buffer:
+            return
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO candidates (run_id, attempt, seed, hours_diff, groups_diff, periods, "
+                "student_hours, assignment) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", self._buffer)
+        self._buffer = []
+
+    def top(self, k=10, max_groups_diff=None, run_id=None):
+        """依人次差異（再依備課組別差異）取前 k 個備課組別差異不超過上限的分配"""
+        if max_groups_diff is None:
+            max_groups_diff = config.MAX_GROUPS_SPREAD
+        query = ("SELECT c.id, c.run_id, c.attempt, c.seed, c.hours_diff, c.groups_diff, c.periods, "
+                 "c.student_hours, r.teachers FROM candidates c JOIN runs r ON r.id = c.run_id "
+                 "WHERE c.groups_diff <= ?")
+        params = [max_groups_diff]
+        if run_id is not None:
+            query += " AND c.run_id = ?"
+            params.append(run_id)
+        query += " ORDER BY c.hours_diff, c.groups_diff, c.id LIMIT ?"
+        params.append(k)
+        rows = self.connection.execute(query, params).fetchall()
+        return [{
+            "id": row[0], "run_id": row[1], "attempt": row[2], "seed": row[3],
+            "hours_diff": row[4], "groups_diff": row[5],
+            "節數": dict(zip(json.loads(row[8]), json.loads(row[6]))),
+            "人次": dict(zip(json.loads(row[8]), json.loads(row[7]))),
+        } for row in rows]
+
+    def load_solution(self, candidate_id, courses):
+        """依編號還原分配；課表與儲存時不同時拋出 ValueError"""
+        row = self.connection.execute(
+            "SELECT c.assignment, r.teachers, r.course_signature FROM candidates c "
+            "JOIN runs r ON r.id = c.run_id WHERE c.id = ?", (candidate_id,)).fetchone()
+        if row is None:
+            raise ValueError(f"找不到編號 {candidate_id} 的分配")
+        assignment, teachers, signature = row
+        table = as_course_table(courses)
+        if signature != course_signature(table):
+            raise ValueError("課表與儲存這個分配時的課表不同")
+        teachers = json.loads(teachers)
+        loads = {t: TeacherLoad() for t in teachers}
+        for course_id, k in enumerate(assignment):
+            if k != 255:
+                loads[teachers[k]].add(table[course_id])
+        return loads
+
+    def close(self):
+        self.flush()
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def __getstate__(self):
+        # 連線與緩衝區不跟著序列化，各工作行程各自連線寫入
+        state = self.__dict__.copy()
+        state["_connection"] = None
+        state["_buffer"] = []
+        return state
+
+
+def record_candidate(store, final_loads, hours_diff, groups_diff, attempt=None, seed=None):
+    """store 不為 None 時記錄分配"""
+    if store is not None:
+        store.add({t: as_teacher_load(load) for t, load in final_loads.items()},
+                  hours_diff, groups_diff, attempt, seed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="查詢分配候選資料庫")
+    parser.add_argument("--db", default=None, help="SQLite 檔案路徑（預設為 config.CANDIDATE_DB_PATH）")
+    parser.add_argument("--top", type=int, default=10, help="列出人次差異最小的前幾個分配")
+    parser.add_argument("--run", type=int, default=None, help="只查詢某次搜尋")
+    args = parser.parse_args(argv)
+
+    store = CandidateStore(args.db)
+    if store.path is None:
+        parser.error("請以 --db 指定資料庫，或設定 config.CANDIDATE_DB_PATH")
+    for row in store.top(args.top, run_id=args.run):
+        print(f"#{row['id']:<6} 搜尋 {row['run_id']:<4} 種子 {row['seed']}  "
+              f"人次差異 {row['hours_diff']:<3} 備課組別差異 {row['groups_diff']}  "
+              f"人次 {list(row['人次'].values())}")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -4,13 +4,64 @@ import os
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 EXCEL_PATH = os.path.join(BASE_DIR, "113學年度特殊教育學生課程領域分組及節數一覽表加上正式老師名字.xlsx")
 OUTPUT_PATH = os.path.join(BASE_DIR, "output")
+CACHE_PATH = os.path.join(OUTPUT_PATH, "cache")  # 解析後課表等資料的快取
 
 # 確保輸出資料夾存在
 os.makedirs(OUTPUT_PATH, exist_ok=True)
 
+# Excel 結果匯出模式："copy" 載入原始活頁簿後另存、"separate" 唯寫模式另存只含結果的檔案、
+# "patch" 不載入原始活頁簿，直接在 xlsx 壓縮檔中加入結果工作表
+EXCEL_EXPORT_MODE = "copy"
+
+# FET 匯出設定："fet" 產生 .fet 檔，"csv" 產生四個 CSV 檔
+FET_EXPORT_FORMAT = "fet"
+FET_VERSION = "6.9.0"
+FET_INSTITUTION = "特殊教育班"
+FET_DAYS = 5
+FET_HOURS_PER_DAY = 7
+
+# 課程資料來源："table" 使用 table.py 中的課程，"excel" 從 EXCEL_PATH 讀取
+COURSE_SOURCE = "table"
+
 # 教師名單
 TEACHERS = ["A老師", "B老師", "C老師", "D老師", "E老師"]
 
 # 課程類型
 BASIC_SUBJECTS = ["社會", "動作", "學習"]
-MAIN_SUBJECTS = ["國語", "數學"]
\ No newline at end of file
+MAIN_SUBJECTS = ["國語", "數學"]
+
+# 每位老師的總節數
+TEACHER_PERIODS = 16
+
+# 搜尋設定
+SOLVER_MODE = "restart"      # "restart": 隨機特需分配 + ILP 重複嘗試；"global": 單一 ILP 一次求解；
+                             # "exhaustive": 列舉所有通過 verify_allocation 的特需分配（老師互換視為相同，國數簽章相同只求解一次）；
+                             #   預設課表有 737,280 種分配、9,255 個不同簽章：以 cp 約 30 分鐘，highs（每次約 1 秒）約 3 小時，
+                             #   cbc（每次 4–12 秒）超過 10 小時，因此國數求解改用 EXHAUSTIVE_BACKEND；
+                             # "pareto": 重複嘗試並保留人次差異與備課組別差異的所有非支配解
+MAX_ATTEMPTS = 1000          # 最多嘗試次數
+SEARCH_WORKERS = 1           # 平行搜尋的行程數（1 表示不平行）
+SEARCH_CHUNK_SIZE = 25       # 每個工作批次包含的嘗試次數
+SEARCH_SEED = None           # 搜尋的起始種子（None 表示每次隨機）
+SOLVER_BACKEND = "cbc"       # 求解器後端："cbc"（子行程）、"highs"（需安裝 highspy，在同一行程內求解）或 "cp"（純 Python，只解國數分配）
+CP_FALLBACK_BACKEND = "cbc"  # 使用 "cp" 時，國數以外的模型（global 模式、grab.py、last.py）改用的後端
+EXHAUSTIVE_BACKEND = "cp"    # exhaustive 模式國數求解使用的後端（cp 與 ILP 結果相同，此模式下約比 highs 快 7 倍），None 表示依 SOLVER_BACKEND
+SOLVE_TIME_LIMIT = None      # 單次求解的時間上限（秒），None 表示不限制
+SOLVE_MIP_GAP = None         # 單次求解的相對 MIP gap（例如 0.01），None 表示求到最佳解
+SEARCH_TIME_LIMIT = None     # 整次搜尋的時間上限（秒），None 表示只受 MAX_ATTEMPTS 限制
+LOCAL_SEARCH = False         # 每次求得可行解後以交換課程的區域搜尋改善人次與備課組別差異（會改變搜尋結果與耗時，預設關閉）
+LOCAL_SEARCH_ITERATIONS = 1000  # 區域搜尋最多交換次數
+SOLVE_CACHE_SIZE = 4096      # 國數求解快取的最大項目數
+GROUPS_SPREAD_WEIGHT = None  # 目標函數中備課組差異相對於人次差異的權重，None 表示只在人次差異相同時比較（人次優先）
+MAX_GROUPS_SPREAD = 1        # 可接受的備課組別差異上限
+SUBSET_SUM_PREFILTER = True  # 國數求解前先以子集合和檢查剩餘節數能否剛好湊出，不能時直接判定無解
+SUBSET_SUM_NODE_LIMIT = 20000  # 節數檢查最多展開的狀態數，超過時交給求解器判定
+PREFILTER_CACHE_SIZE = 1024  # 節數檢查結果快取的最大項目數（與 SOLVE_CACHE_SIZE 分開計算）
+PREFILTER_TABLE_CACHE_SIZE = 16  # 節數檢查的子集合和表快取的最大項目數（依尚未分配的課程組合）
+ENFORCE_CHINESE_MATH_IN_SOLVER = False  # 在國數模型中要求每位老師都有國語和數學（預設 False：與原流程相同，求解後以 verify_chinese_math 檢查）
+TRACE_PATH = None            # 搜尋追蹤檔（JSON-lines）路徑，None 表示不寫檔，只輸出統計摘要
+CANDIDATE_DB_PATH = None     # 保存每個評估過的分配的 SQLite 檔路徑（例如 os.path.join(OUTPUT_PATH, "candidates.db")），None 表示不保存
+CANDIDATE_BATCH_SIZE = 500   # 分配累積幾筆後在一個交易中批次寫入
+CHECKPOINT_PATH = None       # 搜尋檢查點檔路徑（例如 os.path.join(OUTPUT_PATH, "search.ckpt")），None 表示不寫檢查點
+CHECKPOINT_INTERVAL = 50     # 單一行程搜尋時每幾次嘗試寫一次檢查點（平行搜尋時為每個工作批次）
+RESUME_SEARCH = False        # 啟動時從檢查點接續上次的搜尋（也可用命令列參數 --resume）
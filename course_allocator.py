@@ -1,14 +1,24 @@
 # course_allocator.py
 from typing import List, Dict, Any, Tuple
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 from pulp import *
 import copy
+import config
 # 從 table.py 導入所需的函數和變數
-from table import allocate_courses, courses, teachers
+from table import allocate_courses, find_special_courses, courses, teachers
+from course_table import CourseTable, as_course_table
+from teacher_load import TeacherLoad, as_teacher_load
+from search_trace import NULL_TRACER
+from subset_sum import CHINESE, MATH, suffix_tables, can_partition
 
 # 導出 allocate_courses 讓其他模組可以使用
 __all__ = ['allocate_courses', 'allocate_chinese_math', 'calculate_basic_prep_groups', 
-           'calculate_chinese_math_prep_groups', 'verify_chinese_math']
+           'calculate_chinese_math_prep_groups', 'verify_chinese_math', 'allocate_all_courses',
+           'ChineseMathModel', 'get_chinese_math_model', 'SolveCache',
+           'add_conflict_constraints', 'CourseTable', 'TeacherLoad',
+           'SolverBackend', 'CpBackend', 'register_solver_backend', 'get_solver_backend',
+           'chinese_math_pareto_front', 'export_solve_cache', 'restore_solve_cache', 'groups_tie_break',
+           'phase2_key']
 
 def get_prep_group_id(course):
     """獲取課程的備課組別ID"""
@@ -27,130 +37,794 @@ def get_prep_group_id(course):
 
 def calculate_basic_prep_groups(teacher_load):
     """計算特需課程的備課組別數"""
-    basic_courses = [c for c in teacher_load["課程"] 
-                    if c["課程名稱"] in ["社會", "動作", "學習"]]
-    return len(basic_courses)
+    return as_teacher_load(teacher_load).basic_prep_groups
 
 def calculate_chinese_math_prep_groups(teacher_load):
     """計算國數的備課組別數"""
-    groups = defaultdict(list)
-    for course in teacher_load["課程"]:
-        if course["課程名稱"] in ["國語", "數學"]:
-            key = f"{course['課程名稱']}_{course['年級']}"
-            groups[key].append(course)
-    return len(groups)
-
-def allocate_chinese_math(initial_loads, courses):
-    """使用整數線性規劃分配尚未分配的國文與數學課"""
-    import copy
-    from pulp import LpProblem, LpMinimize, LpVariable, lpSum, value, LpBinary, PULP_CBC_CMD
-    from collections import defaultdict
-
-    result = initial_loads.copy()
-
-    # 找出已經分配的課程 id
+    return as_teacher_load(teacher_load).chinese_math_prep_groups
+
+def build_group_index(courses, indices=None):
+    """依 (年級, 組別) 建立索引，只保留同組內有不同科目的組別
+
+    回傳 [{科目: [課程編號, ...]}, ...]，每個元素代表一個可能衝突的組別。
+    """
+    if indices is None:
+        indices = range(len(courses))
+    index = defaultdict(lambda: defaultdict(list))
+    if isinstance(courses, CourseTable):
+        # 直接使用整數編碼的欄位
+        for i in indices:
+            key = (courses.grades[i], courses.group_codes[i])
+            index[key][courses.subject_codes[i]].append(i)
+    else:
+        for i in indices:
+            course = courses[i]
+            index[(course["年級"], course["組別"])][course["課程名稱"]].append(i)
+    return [dict(subjects) for subjects in index.values() if len(subjects) > 1]
+
+
+def add_conflict_constraints(prob, teacher_course, courses, teachers, indices=None):
+    """同年級同組別不同科目不能由同一人授課
+
+    透過 (年級, 組別) 索引只處理真正會衝突的組別。每個科目只有一堂課時
+    （最常見的情況），每組每位老師只需一條 sum <= 1 的彙總限制；
+    同組同科目有多堂課時，改為每堂課一條
+    n * x_i + sum(其他科目) <= n 的限制，模型大小仍隨課程數線性成長。
+    """
+    for subjects in build_group_index(courses, indices):
+        members = [i for group in subjects.values() for i in group]
+        if all(len(group) == 1 for group in subjects.values()):
+            for t in teachers:
+                prob += lpSum(teacher_course[t, i] for i in members) <= 1
+            continue
+
+        for subject, group in subjects.items():
+            others = [i for other, ids in subjects.items() if other != subject for i in ids]
+            for t in teachers:
+                other_sum = lpSum(teacher_course[t, j] for j in others)
+                for i in group:
+                    prob += len(others) * teacher_course[t, i] + other_sum <= len(others)
+
+
+def add_prep_group_indicators(prob, teacher_course, courses, teachers, indices=None):
+    """建立老師 × 國數備課組別（科目 + 年級）的指標變數並與分配變數連動
+
+    指標為 1 若且唯若該老師至少分到組內一堂課（下界與上界限制都加上，
+    避免求解器為了平衡而虛報備課組別）。回傳 {老師: 國數備課組別數的運算式}。
+    """
+    if indices is None:
+        indices = range(len(courses))
+    members = defaultdict(list)
+    for i in indices:
+        members[(courses[i]["課程名稱"], courses[i]["年級"])].append(i)
+    prep_keys = sorted(members)
+
+    prep_group = LpVariable.dicts("PrepGroup",
+        ((t, k) for t in teachers for k in range(len(prep_keys))),
+        cat=LpBinary)
+
+    for k, key in enumerate(prep_keys):
+        for t in teachers:
+            for i in members[key]:
+                prob += prep_group[t, k] >= teacher_course[t, i]
+            prob += prep_group[t, k] <= lpSum(teacher_course[t, i] for i in members[key])
+
+    return {t: lpSum(prep_group[t, k] for k in range(len(prep_keys))) for t in teachers}
+
+
+# 未傳入參數時的標記（None 代表不限制）
+_DEFAULT = object()
+
+
+def groups_tie_break(courses):
+    """只在人次差異相同時比較備課組差異的權重
+
+    備課組差異不會超過課程數，權重取 1 / (課程數 + 1) 時備課組項總和小於 1，
+    而人次差異為整數，因此求解結果一定是備課組差異上限內人次差異最小的解。
+    """
+    return 1 / (len(courses) + 1)
+
+
+class SolverBackend:
+    """求解器後端：求解 PuLP 模型並回傳 PuLP 的狀態碼
+
+    time_limit（秒）與 gap（相對 MIP gap）會傳給求解器；在時間限制內找到
+    可行但未證明最佳的解時同樣回傳 1，並以 last_optimal 標示是否為已證明的最佳解。
+    """
+
+    name = None
+
+    def __init__(self, time_limit=None, gap=None):
+        self.time_limit = time_limit
+        self.gap = gap
+        self.last_optimal = None
+
+    def command(self, warm_start=False):
+        """建立 PuLP 的求解器物件"""
+        raise NotImplementedError
+
+    def available(self):
+        """此後端在目前環境中是否可用"""
+        return self.command().available()
+
+    def solve(self, prob, warm_start=False):
+        from pulp import LpSolutionOptimal, LpStatusNotSolved
+
+        status = prob.solve(self.command(warm_start))
+        self.last_optimal = status == 1 and prob.sol_status == LpSolutionOptimal
+        # 因時間限制或 gap 提前結束時，確認求解器真的留下了可行解
+        if status == 1 and not self.last_optimal and not prob.valid(1e-6):
+            return LpStatusNotSolved
+        return status
+
+
+class CbcBackend(SolverBackend):
+    """CBC 子行程：寫出模型檔、啟動 cbc 並讀回解檔"""
+
+    name = "cbc"
+
+    def command(self, warm_start=False):
+        from pulp import PULP_CBC_CMD
+        return PULP_CBC_CMD(msg=False, warmStart=warm_start, timeLimit=self.time_limit, gapRel=self.gap)
+
+
+class HighsBackend(SolverBackend):
+    """HiGHS（透過 highspy 在同一行程內求解，不需寫檔與啟動子行程）"""
+
+    name = "highs"
+
+    def command(self, warm_start=False):
+        # highspy 介面不支援起始解，warm_start 直接忽略
+        from pulp import HiGHS
+        return HiGHS(msg=False, timeLimit=self.time_limit, gapRel=self.gap)
+
+
+class CpBackend(SolverBackend):
+    """純 Python 的約束傳播 + 分支定界求解器（cp_solver），不需 CBC 或 HiGHS
+
+    國數模型（ChineseMathModel）直接以 solve_model 求解；其他 PuLP 模型
+    （global 模式、grab.py、last.py）交給 config.CP_FALLBACK_BACKEND。
+    """
+
+    name = "cp"
+
+    def available(self):
+        return True
+
+    def solve_model(self, model):
+        """直接求解國數模型目前的參數，回傳 (狀態碼, {老師: [課程位置, ...]} 或 None)"""
+        groups_weight, groups_limit = model.tradeoff
+        status, assignment, self.last_optimal = model.cp_solver().solve(
+            model.teachers, *model.params, groups_weight=groups_weight, groups_limit=groups_limit,
+            time_limit=self.time_limit, gap=self.gap)
+        return status, assignment
+
+    def solve(self, prob, warm_start=False):
+        fallback = get_solver_backend(config.CP_FALLBACK_BACKEND, self.time_limit, self.gap)
+        status = fallback.solve(prob, warm_start)
+        self.last_optimal = fallback.last_optimal
+        return status
+
+
+# 可用的求解器後端（名稱 → 類別），可用 register_solver_backend 加入新的後端
+SOLVER_BACKENDS = {
+    CbcBackend.name: CbcBackend,
+    HighsBackend.name: HighsBackend,
+    CpBackend.name: CpBackend,
+}
+
+
+def register_solver_backend(name, backend_class):
+    """註冊求解器後端"""
+    SOLVER_BACKENDS[name] = backend_class
+
+
+def get_solver_backend(name=None, time_limit=_DEFAULT, gap=_DEFAULT):
+    """依名稱取得求解器後端
+
+    名稱未指定時使用 config.SOLVER_BACKEND；time_limit、gap 未指定時使用
+    config.SOLVE_TIME_LIMIT、config.SOLVE_MIP_GAP（None 表示不限制）。
+    """
+    if isinstance(name, SolverBackend):
+        return name
+    name = name or config.SOLVER_BACKEND
+    if name not in SOLVER_BACKENDS:
+        raise ValueError(f"未知的求解器後端：{name}（可用：{', '.join(SOLVER_BACKENDS)}）")
+    if time_limit is _DEFAULT:
+        time_limit = config.SOLVE_TIME_LIMIT
+    if gap is _DEFAULT:
+        gap = config.SOLVE_MIP_GAP
+    backend = SOLVER_BACKENDS[name](time_limit=time_limit, gap=gap)
+    if not backend.available():
+        raise RuntimeError(f"求解器後端 {name} 無法使用，請確認是否已安裝對應的套件")
+    return backend
+
+
+def selected_courses(teacher_course, teachers, indices):
+    """讀出每位老師被分配的課程位置（以 0.5 為界，避免求解器回傳 0.9999 之類的值）"""
+    from pulp import value
+    return {t: [i for i in indices if value(teacher_course[t, i]) > 0.5] for t in teachers}
+
+
+# 快取中找不到鍵值時的標記（None 代表已知無解）
+_MISSING = object()
+
+
+class SolveCache:
+    """國數求解結果的 LRU 快取，連同無解的情況一併記錄"""
+
+    def __init__(self, maxsize=None):
+        self.maxsize = maxsize if maxsize is not None else config.SOLVE_CACHE_SIZE
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """取得快取結果，找不到時回傳 _MISSING"""
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        self.misses += 1
+        return _MISSING
+
+    def put(self, key, value):
+        """寫入快取，超過容量時淘汰最久未使用的項目"""
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def items(self):
+        """依使用先後列出 (鍵值, 結果)，可序列化後以 update() 還原"""
+        return list(self.entries.items())
+
+    def update(self, items):
+        """寫入多筆快取結果（例如從檢查點還原）"""
+        for key, value in items:
+            self.put(key, value)
+
+
+def phase2_signature(teachers, remaining_course_ids, remaining_lessons, current_student_hours,
+                     special_prep_groups, coverage=None):
+    """計算與老師排列無關的國數求解簽章
+
+    國數模型只看每位老師的 (剩餘節數, 目前人次, 特需備課組數)（以及是否需補國語、數學），
+    因此依這些值排序老師後即可得到正規化的鍵值；回傳 (鍵值, 排序後的老師)。
+    """
+    def params(t):
+        needs = coverage[t] if coverage is not None else None
+        return (remaining_lessons[t], current_student_hours[t], special_prep_groups[t], needs)
+
+    slots = sorted(teachers, key=lambda t: (params(t), t))
+    loads = tuple(params(t) for t in slots)
+    return (loads, frozenset(remaining_course_ids)), slots
+
+
+class ChineseMathModel:
+    """國數分配的常駐 ILP 模型
+
+    每份課表只建立一次變數、衝堂限制、國數備課組別指標與平衡限制；每次嘗試只更新
+    尚未分配的課程、剩餘節數、目前人次與特需備課組數等右手邊常數，
+    並以上一次的解作為 CBC 的起始解。
+    """
+
+    def __init__(self, courses, teachers):
+        from pulp import LpProblem, LpMinimize, LpVariable, lpSum, LpBinary, LpInteger
+
+        self.table = as_course_table(courses)
+        self.teachers = list(teachers)
+
+        # 課表中所有國語與數學課程（course_ids 為課表中的編號）
+        self.course_ids = self.table.ids_of("國語", "數學")
+        self.courses = [self.table[i] for i in self.course_ids]
+        course_indices = range(len(self.courses))
+
+        prob = LpProblem("CourseAllocation", LpMinimize)
+
+        # 定義變數
+        teacher_course = LpVariable.dicts("Assign",
+            ((t, i) for t in self.teachers for i in course_indices),
+            cat=LpBinary)
+
+        # 人次與備課組數皆為整數，宣告為整數變數可讓下界取整
+        max_student_hours = LpVariable("MaxStudentHours", 0, None, LpInteger)
+        min_student_hours = LpVariable("MinStudentHours", 0, None, LpInteger)
+        max_prep_groups = LpVariable("MaxPrepGroups", 0, None, LpInteger)
+        min_prep_groups = LpVariable("MinPrepGroups", 0, None, LpInteger)
+
+        # 每堂尚未分配的課只能分配給一位老師（已分配者右手邊為 0）
+        self.course_constraints = {}
+        for i in course_indices:
+            constraint = lpSum(teacher_course[t, i] for t in self.teachers) == 1
+            prob += constraint
+            self.course_constraints[i] = constraint
+
+        # 每位老師的總節數 = 剩餘節數（強制）
+        self.lesson_constraints = {}
+        for t in self.teachers:
+            constraint = lpSum(
+                teacher_course[t, i] * self.courses[i]["節數"]
+                for i in course_indices
+            ) == 0
+            prob += constraint
+            self.lesson_constraints[t] = constraint
+
+        # 同年級同組別不同科目不能由同一人授課
+        add_conflict_constraints(prob, teacher_course, CourseTable(self.courses), self.teachers)
+
+        # 每位老師至少一堂國語和一堂數學（右手邊為 0 時不限制）
+        self.coverage_constraints = {}
+        for t in self.teachers:
+            chinese = lpSum(teacher_course[t, i] for i in course_indices
+                            if self.courses[i]["課程名稱"] == "國語") >= 0
+            math = lpSum(teacher_course[t, i] for i in course_indices
+                         if self.courses[i]["課程名稱"] == "數學") >= 0
+            prob += chinese
+            prob += math
+            self.coverage_constraints[t] = (chinese, math)
+
+        # 國數備課組別指標，讓備課組數平衡看得到求解器選擇的國數組別
+        chinese_math_groups = add_prep_group_indicators(prob, teacher_course, self.courses, self.teachers)
+
+        # 限制人次與備課組數，目前人次與特需備課組數以右手邊常數表示
+        self.hours_constraints = {}
+        self.groups_constraints = {}
+        for t in self.teachers:
+            added_hours = lpSum(
+                teacher_course[t, i] * self.courses[i]["人次"]
+                for i in course_indices)
+            upper = max_student_hours - added_hours >= 0
+            lower = min_student_hours - added_hours <= 0
+            prob += upper
+            prob += lower
+            self.hours_constraints[t] = (upper, lower)
+
+            upper = max_prep_groups - chinese_math_groups[t] >= 0
+            lower = min_prep_groups - chinese_math_groups[t] <= 0
+            prob += upper
+            prob += lower
+            self.groups_constraints[t] = (upper, lower)
+
+        # 目標函數：平衡人次與備課組數（權重可由 set_tradeoff 調整）
+        self.hours_spread = max_student_hours - min_student_hours
+        self.groups_spread = max_prep_groups - min_prep_groups
+
+        # 備課組差異（特需 + 國數）的上限，右手邊由 set_tradeoff 調整
+        self.groups_limit = self.groups_spread <= 0
+        prob += self.groups_limit
+
+        self.prob = prob
+        self.teacher_course = teacher_course
+        self.solve_cache = SolveCache()
+        self.last_conclusive = False
+        self.tradeoff = None
+        self.set_tradeoff()
+        # 節數可行性檢查各自的快取，不與求解結果共用容量：
+        # 尚未分配的課程 → 子集合和表，(課程, 各老師需求) → 結果
+        self.suffix_table_cache = SolveCache(config.PREFILTER_TABLE_CACHE_SIZE)
+        self.prefilter_cache = SolveCache(config.PREFILTER_CACHE_SIZE)
+        self.params = None
+        self._cp_solver = None
+
+    def cp_solver(self):
+        """此課表的 cp_solver.ChineseMathCP，第一次使用時才建立"""
+        if self._cp_solver is None:
+            from cp_solver import ChineseMathCP
+            self._cp_solver = ChineseMathCP(self.courses)
+        return self._cp_solver
+
+    def periods_feasible(self, remaining, remaining_lessons, current_student_hours=None,
+                         special_prep_groups=None, coverage=None):
+        """求解前的必要條件檢查（子集合和／多背包），回傳 False 時模型必定無解
+
+        尚未分配的課程必須能剛好分成每位老師的剩餘節數，需補國語、數學的老師
+        還要分到該科（見 subset_sum.can_partition）。參數與 update() 相同；
+        展開超過 config.SUBSET_SUM_NODE_LIMIT 個狀態仍無法判定時視為可行，交給求解器。
+        """
+        remaining = frozenset(remaining)
+        bins = []
+        for t, lessons in remaining_lessons.items():
+            need_chinese, need_math = coverage[t] if coverage is not None else (False, False)
+            bins.append((lessons, (CHINESE if need_chinese else 0) | (MATH if need_math else 0)))
+        key = (remaining, tuple(sorted(bins)))
+
+        feasible = self.prefilter_cache.get(key)
+        if feasible is _MISSING:
+            tables = self.suffix_table_cache.get(remaining)
+            if tables is _MISSING:
+                tables = suffix_tables(
+                    (self.courses[i]["節數"], CHINESE if self.courses[i]["課程名稱"] == "國語" else MATH)
+                    for i in remaining)
+                self.suffix_table_cache.put(remaining, tables)
+            feasible = can_partition(tables, bins, config.SUBSET_SUM_NODE_LIMIT) is not False
+            self.prefilter_cache.put(key, feasible)
+        return feasible
+
+    def set_tradeoff(self, groups_weight=None, groups_limit=_DEFAULT):
+        """設定目標函數中備課組差異的權重與備課組差異上限（ε-限制）
+
+        未指定時使用 config.GROUPS_SPREAD_WEIGHT 與 config.MAX_GROUPS_SPREAD；
+        權重為 None 時以 groups_tie_break() 只在人次差異相同時比較備課組差異，
+        groups_limit 為 None 表示不限制。
+        """
+        if groups_weight is None:
+            groups_weight = config.GROUPS_SPREAD_WEIGHT
+        if groups_weight is None:
+            groups_weight = groups_tie_break(self.table)
+        if groups_limit is _DEFAULT:
+            groups_limit = config.MAX_GROUPS_SPREAD
+        if self.tradeoff == (groups_weight, groups_limit):
+            return
+        self.prob.setObjective(self.hours_spread + groups_weight * self.groups_spread)
+        # 不限制時以所有課程數為上限（備課組數不可能超過課程數）
+        self.groups_limit.changeRHS(groups_limit if groups_limit is not None else len(self.table))
+        self.tradeoff = (groups_weight, groups_limit)
+
+    def update(self, remaining, remaining_lessons, current_student_hours, special_prep_groups,
+               coverage=None):
+        """更新本次嘗試的右手邊常數
+
+        remaining 為尚未分配課程在模型中的位置；coverage 為 {老師: (需補國語, 需補數學)}，
+        None 表示不在模型中要求國數都要有。
+        """
+        self.params = (remaining, remaining_lessons, current_student_hours, special_prep_groups, coverage)
+        remaining = set(remaining)
+        for i, constraint in self.course_constraints.items():
+            constraint.changeRHS(1 if i in remaining else 0)
+
+        for t in self.teachers:
+            self.lesson_constraints[t].changeRHS(remaining_lessons[t])
+
+            upper, lower = self.hours_constraints[t]
+            upper.changeRHS(current_student_hours[t])
+            lower.changeRHS(current_student_hours[t])
+
+            upper, lower = self.groups_constraints[t]
+            upper.changeRHS(special_prep_groups[t])
+            lower.changeRHS(special_prep_groups[t])
+
+            need_chinese, need_math = coverage[t] if coverage is not None else (False, False)
+            chinese, math = self.coverage_constraints[t]
+            chinese.changeRHS(1 if need_chinese else 0)
+            math.changeRHS(1 if need_math else 0)
+
+    def solve(self, backend=None):
+        """求解，回傳每位老師分到的國數課程編號；無解時回傳 None"""
+        from pulp import LpStatusInfeasible
+
+        backend = get_solver_backend(backend)
+        if hasattr(backend, "solve_model"):
+            # 直接在模型參數上求解的後端（例如 cp）
+            status, assignment = backend.solve_model(self)
+            self.last_conclusive = backend.last_optimal or status == LpStatusInfeasible
+            return assignment if status == 1 else None
+
+        # 以上一次的解作為起始解（後端支援時）
+        status = backend.solve(self.prob, warm_start=True)
+        # 只有證明最佳或證明無解的結果可以放進快取（受時間限制提前結束的不算）
+        self.last_conclusive = backend.last_optimal or status == LpStatusInfeasible
+
+        if status != 1:
+            return None
+
+        return selected_courses(self.teacher_course, self.teachers, range(len(self.courses)))
+
+
+# 每份課表對應的常駐模型（與 as_course_table 相同，只保留最近使用的幾份，
+# 避免重新載入的課表或基準測試的課表讓模型與求解快取一直留在記憶體中）
+_chinese_math_models = OrderedDict()
+_MAX_CACHED_MODELS = 16
+
+
+def get_chinese_math_model(courses, teachers):
+    """取得該課表的常駐國數模型，第一次使用時才建立"""
+    table = as_course_table(courses)
+    key = (id(table), tuple(sorted(teachers)))
+    model = _chinese_math_models.get(key)
+    if model is None or model.table is not table:
+        model = ChineseMathModel(table, sorted(teachers))
+        _chinese_math_models[key] = model
+        while len(_chinese_math_models) > _MAX_CACHED_MODELS:
+            _chinese_math_models.popitem(last=False)
+    _chinese_math_models.move_to_end(key)
+    return model
+
+
+def export_solve_cache(courses, teachers):
+    """取出該課表國數模型的求解快取內容（可序列化，用於檢查點）"""
+    return get_chinese_math_model(courses, teachers).solve_cache.items()
+
+
+def restore_solve_cache(courses, teachers, items):
+    """將 export_solve_cache() 取出的內容寫回該課表的國數模型"""
+    get_chinese_math_model(courses, teachers).solve_cache.update(items)
+
+
+def phase2_inputs(result, table, model, require_chinese_math=None):
+    """計算國數模型本次嘗試的參數
+
+    回傳 (尚未分配的國數課程在模型中的位置, 剩餘節數, 目前人次, 特需備課組數, coverage)。
+    """
+    # 找出已經分配的課程編號
     assigned_course_ids = set(
-        id(c) for load in result.values() for c in load["課程"]
+        table.course_id(c) for load in result.values() for c in load["課程"]
     )
 
-    # 保留尚未被分配的國語或數學課程
+    # 保留尚未被分配的國語或數學課程（模型中的位置）
     chinese_math_courses = [
-        c for c in courses
-        if c["課程名稱"] in ["國語", "數學"] and id(c) not in assigned_course_ids
+        i for i, course_id in enumerate(model.course_ids)
+        if course_id not in assigned_course_ids
     ]
 
     # 計算老師剩餘可排節數
     remaining_lessons = {
-        t: 16 - load["節數"]
+        t: config.TEACHER_PERIODS - load["節數"]
+        for t, load in result.items()
+    }
+
+    # 計算特需課的備課組數
+    special_prep_groups = {
+        t: calculate_basic_prep_groups(load)
         for t, load in result.items()
     }
 
+    current_student_hours = {t: result[t]["人次"] for t in result.keys()}
+
+    # 設定 ENFORCE_CHINESE_MATH_IN_SOLVER（或 require_chinese_math=True）時把「每位老師都有國語和數學」
+    # 直接寫進模型，不再事後以 verify_chinese_math 篩掉
+    if require_chinese_math is None:
+        require_chinese_math = config.ENFORCE_CHINESE_MATH_IN_SOLVER
+    coverage = None
+    if require_chinese_math:
+        coverage = {t: (not load.has_chinese, not load.has_math) for t, load in result.items()}
+
+    return chinese_math_courses, remaining_lessons, current_student_hours, special_prep_groups, coverage
+
+
+def phase2_key(initial_loads, courses, require_chinese_math=None):
+    """第一階段結果在國數求解快取中的鍵值（與老師排列無關）
+
+    鍵值相同的第一階段結果，國數分配的最佳人次與備課組別差異也相同，
+    因此列舉時只需求解每個鍵值一次。
+    """
+    loads = {t: as_teacher_load(load) for t, load in initial_loads.items()}
+    table = as_course_table(courses)
+    model = get_chinese_math_model(table, loads.keys())
+    key, _ = phase2_signature(loads.keys(), *phase2_inputs(loads, table, model, require_chinese_math))
+    return key
+
+
+def allocate_chinese_math(initial_loads, courses, require_chinese_math=None, tracer=NULL_TRACER,
+                          backend=None):
+    """使用整數線性規劃分配尚未分配的國文與數學課
+
+    require_chinese_math 為 True 時在模型中要求每位老師都有國語和數學，
+    None 時依 config.ENFORCE_CHINESE_MATH_IN_SOLVER。
+    backend 為求解器後端名稱，None 時依 config.SOLVER_BACKEND。
+    tracer 會記錄 model_build、solve 兩個階段的耗時與快取命中次數。
+    """
+    # 複製負載，不修改呼叫端傳入的第一階段結果
+    result = {t: as_teacher_load(load).copy() for t, load in initial_loads.items()}
+    with tracer.phase("model_build"):
+        table = as_course_table(courses)
+        model = get_chinese_math_model(table, result.keys())
+        model.set_tradeoff()
+
+    params = phase2_inputs(result, table, model, require_chinese_math)
+    chinese_math_courses = params[0]
 
     # 沒有需要分配的國數課就直接回傳
     if not chinese_math_courses:
         return result
 
-    prob = LpProblem("CourseAllocation", LpMinimize)
+    # 剩餘節數無法由尚未分配的課程剛好湊出時不必建模求解
+    if config.SUBSET_SUM_PREFILTER and not model.periods_feasible(*params):
+        tracer.count("subset_sum_pruned")
+        return None
 
-    # 計算特需課的備課組數
-    special_prep_groups = {
-        t: calculate_basic_prep_groups(load)
-        for t, load in result.items()
-    }
+    # 相同簽章（與老師順序無關）的狀態直接取用快取結果，包含無解的情況
+    key, slots = phase2_signature(result.keys(), *params)
+    key = (key, model.tradeoff)
+    cached = model.solve_cache.get(key)
+
+    if cached is _MISSING:
+        # 取得常駐模型並只更新本次嘗試的參數
+        with tracer.phase("model_build"):
+            model.update(*params)
+
+        # 求解
+        with tracer.phase("solve"):
+            assignment = model.solve(backend)
+        if assignment is not None:
+            cached = tuple(tuple(assignment[t]) for t in slots)
+        else:
+            cached = None
+        if model.last_conclusive:
+            model.solve_cache.put(key, cached)
+        elif cached is None:
+            tracer.count("solve_timeout")
+    else:
+        tracer.count("cache_hit")
+
+    if cached is None:
+        return None
+
+    # 寫入結果（快取中的第 k 組課程屬於排序後的第 k 位老師）
+    for t, assigned in zip(slots, cached):
+        for i in assigned:
+            result[t].add(model.courses[i])
+
+    return result
+
+
+def chinese_math_pareto_front(initial_loads, courses, require_chinese_math=True, tracer=NULL_TRACER,
+                              backend=None):
+    """以 ε-限制法求國數分配在 (人次差異, 備課組別差異) 上的所有非支配解
+
+    先在不限制備課組差異下求人次差異最小的解，再把備課組差異上限逐次設為
+    上一個解的備課組差異減一重新求解，直到無解或備課組差異為 0。
+    全部在同一個常駐模型上只改目標權重與右手邊，回傳依備課組差異遞減排列的老師負載列表。
+    require_chinese_math 預設為 True：每一步都要在國數都有的可行解中求解，
+    事後才過濾會在錯的可行集合上取 ε 步，漏掉真正的非支配解。
+    """
+    initial_loads = {t: as_teacher_load(load) for t, load in initial_loads.items()}
+    with tracer.phase("model_build"):
+        table = as_course_table(courses)
+        model = get_chinese_math_model(table, initial_loads.keys())
+    params = phase2_inputs(initial_loads, table, model, require_chinese_math)
+    if not params[0]:
+        return [{t: load.copy() for t, load in initial_loads.items()}]
+    if config.SUBSET_SUM_PREFILTER and not model.periods_feasible(*params):
+        tracer.count("subset_sum_pruned")
+        return []
+
+    # 備課組差異的權重小到不影響人次差異，只用來在人次相同時取備課組較少者
+    tie_break = groups_tie_break(table)
+    front = []
+    limit = None
+    try:
+        with tracer.phase("model_build"):
+            model.update(*params)
+        while True:
+            model.set_tradeoff(tie_break, limit)
+            with tracer.phase("solve"):
+                assignment = model.solve(backend)
+            if assignment is None:
+                break
+
+            result = {t: load.copy() for t, load in initial_loads.items()}
+            for t, assigned in assignment.items():
+                for i in assigned:
+                    result[t].add(model.courses[i])
+            front.append(result)
+
+            groups = [calculate_basic_prep_groups(load) + calculate_chinese_math_prep_groups(load)
+                      for load in result.values()]
+            groups_diff = max(groups) - min(groups)
+            if groups_diff == 0:
+                break
+            limit = groups_diff - 1
+    finally:
+        # 還原預設的權重與上限，讓之後的 allocate_chinese_math 不受影響
+        model.set_tradeoff()
+    return front
+
+
+def allocate_all_courses(courses, teachers, backend=None):
+    """使用單一整數線性規劃同時分配特需課程與國數課程"""
+    from pulp import LpProblem, LpMinimize, LpVariable, lpSum, LpBinary, LpInteger
+
+    courses = as_course_table(courses)
+    course_indices = range(len(courses))
+
+    social = courses.ids_of("社會")
+    action = courses.ids_of("動作")
+    study = courses.ids_of("學習")
+    chinese = courses.ids_of("國語")
+    math = courses.ids_of("數學")
+    basic = social + action + study
+    special = [courses.course_id(c) for c in find_special_courses(courses)]
+
+    if len(social) != 9 or len(study) != 2:
+        raise ValueError("社會課應為9堂，學習課應為2堂")
+
+    prob = LpProblem("GlobalCourseAllocation", LpMinimize)
 
     # 定義變數
     teacher_course = LpVariable.dicts("Assign",
-        ((t, i) for t in result.keys() for i in range(len(chinese_math_courses))),
+        ((t, i) for t in teachers for i in course_indices),
         cat=LpBinary)
+    # 只有 1 堂社會課的老師
+    one_social = LpVariable.dicts("OneSocial", teachers, cat=LpBinary)
 
-    max_student_hours = LpVariable("MaxStudentHours", 0, None)
-    min_student_hours = LpVariable("MinStudentHours", 0, None)
-    max_prep_groups = LpVariable("MaxPrepGroups", 0, None)
-    min_prep_groups = LpVariable("MinPrepGroups", 0, None)
+    # 人次與備課組數皆為整數，宣告為整數變數可讓下界取整、加速證明最佳
+    max_student_hours = LpVariable("MaxStudentHours", 0, None, LpInteger)
+    min_student_hours = LpVariable("MinStudentHours", 0, None, LpInteger)
+    max_prep_groups = LpVariable("MaxPrepGroups", 0, None, LpInteger)
+    min_prep_groups = LpVariable("MinPrepGroups", 0, None, LpInteger)
 
     # 每堂課只能分配給一位老師
-    for i in range(len(chinese_math_courses)):
-        prob += lpSum(teacher_course[t, i] for t in result.keys()) == 1
+    for i in course_indices:
+        prob += lpSum(teacher_course[t, i] for t in teachers) == 1
+
+    for t in teachers:
+        def count(indices):
+            return lpSum(teacher_course[t, i] for i in indices)
 
-    # 每位老師的總節數 = 剩餘節數（強制）
-    for t in result.keys():
-        prob += lpSum(
-            teacher_course[t, i] * chinese_math_courses[i]["節數"]
-            for i in range(len(chinese_math_courses))
-        ) == remaining_lessons[t]
+        # 每位老師的總節數 = 規定節數（預設 16）
+        prob += (lpSum(teacher_course[t, i] * courses[i]["節數"] for i in course_indices)
+                 == config.TEACHER_PERIODS)
+
+        # 特定 5 堂課平均分給不同老師
+        prob += count(special) <= 1
+
+        # 社會課 1 或 2 堂；只有 1 堂的老師動作、學習課各恰好 1 堂
+        prob += count(social) == 2 - one_social[t]
+        prob += count(action) >= one_social[t]
+        prob += count(action) <= 1 + len(action) * (1 - one_social[t])
+        prob += count(study) >= one_social[t]
+
+        # 沒有老師拿到超過 1 堂學習課
+        prob += count(study) <= 1
+
+        # 每位老師都至少有一堂國語和一堂數學
+        prob += count(chinese) >= 1
+        prob += count(math) >= 1
+
+    # 特定 5 堂課分給不同老師，老師又可互換，因此直接把第 k 堂固定給第 k 位老師，
+    # 打破老師排列的對稱性（不必讓求解器搜尋 5! 種等價的標記）
+    for t, i in zip(teachers, special):
+        prob += teacher_course[t, i] == 1
 
     # 同年級同組別不同科目不能由同一人授課
-    for i in range(len(chinese_math_courses)):
-        for j in range(i + 1, len(chinese_math_courses)):
-            ci = chinese_math_courses[i]
-            cj = chinese_math_courses[j]
-            if ci["年級"] == cj["年級"] and ci["組別"] == cj["組別"] and ci["課程名稱"] != cj["課程名稱"]:
-                for t in result.keys():
-                    prob += teacher_course[t, i] + teacher_course[t, j] <= 1
-
-    # 限制人次與備課組數
-    current_student_hours = {t: result[t]["人次"] for t in result.keys()}
-    for t in result.keys():
-        total_hours = current_student_hours[t] + lpSum(
-            teacher_course[t, i] * chinese_math_courses[i]["人次"]
-            for i in range(len(chinese_math_courses)))
+    main_courses = chinese + math
+    add_conflict_constraints(prob, teacher_course, courses, teachers, main_courses)
+
+    # 國數備課組別指標與分配變數連動
+    chinese_math_groups = add_prep_group_indicators(prob, teacher_course, courses, teachers, main_courses)
+
+    # 限制人次與備課組數（特需課每堂一組，國數依科目 + 年級合併）
+    for t in teachers:
+        total_hours = lpSum(teacher_course[t, i] * courses[i]["人次"] for i in course_indices)
         prob += max_student_hours >= total_hours
         prob += min_student_hours <= total_hours
 
-        total_groups = special_prep_groups[t]
+        total_groups = lpSum(teacher_course[t, i] for i in basic) + chinese_math_groups[t]
         prob += max_prep_groups >= total_groups
         prob += min_prep_groups <= total_groups
 
-    # 目標函數：平衡人次與備課組數
-    prob += (max_student_hours - min_student_hours) + 100 * (max_prep_groups - min_prep_groups)
+    # 目標函數：在備課組差異上限內平衡人次，備課組差異預設只在人次差異相同時比較
+    groups_weight = config.GROUPS_SPREAD_WEIGHT
+    if groups_weight is None:
+        groups_weight = groups_tie_break(courses)
+    prob += (max_student_hours - min_student_hours) + groups_weight * (max_prep_groups - min_prep_groups)
 
-    # 軟性條件：備課組差異不超過 1
-    prob += max_prep_groups - min_prep_groups <= 1
+    # 備課組差異上限
+    prob += max_prep_groups - min_prep_groups <= config.MAX_GROUPS_SPREAD
 
     # 求解
-    status = prob.solve(PULP_CBC_CMD(msg=False))
+    status = get_solver_backend(backend).solve(prob)
 
     if status != 1:
         return None
 
     # 寫入結果
-    for t in result.keys():
-        for i in range(len(chinese_math_courses)):
-            if value(teacher_course[t, i]) == 1:
-                result[t]["課程"].append(chinese_math_courses[i])
-                result[t]["節數"] += chinese_math_courses[i]["節數"]
-                result[t]["人次"] += chinese_math_courses[i]["人次"]
+    result = defaultdict(TeacherLoad)
+    for t, assigned in selected_courses(teacher_course, teachers, course_indices).items():
+        for i in assigned:
+            result[t].add(courses[i])
 
     return result
 
 
-
-
 def verify_chinese_math(loads):
     """檢查每位老師是否都至少有一堂國語和一堂數學"""
     for teacher, load in loads.items():
-        has_chinese = any(c["課程名稱"] == "國語" for c in load["課程"])
-        has_math = any(c["課程名稱"] == "數學" for c in load["課程"])
-        if not (has_chinese and has_math):
+        load = as_teacher_load(load)
+        if not (load.has_chinese and load.has_math):
             return False
     return True
\ No newline at end of file
@@ -0,0 +1,122 @@
+# course_table.py
+from array import array
+from collections import defaultdict
+from operator import is_
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple
+
+
+class CourseTable:
+    """以欄位陣列儲存的課程表
+
+    每堂課有固定的整數編號（即在表中的位置），科目與組別以整數編碼，
+    節數、人數、人次等數值存成 array 欄位，並預先建立
+    (科目, 年級, 組別) 與科目的查詢索引。迭代或索引時仍回傳原本的
+    課程 dict，因此老師負載、驗證與匯出的程式都不需要修改。
+    """
+
+    __slots__ = ("rows", "subject_names", "group_names", "subject_codes", "grades",
+                 "group_codes", "periods", "student_counts", "student_hours",
+                 "_subject_code", "_group_code", "_by_key", "_by_subject", "_id_of")
+
+    def __init__(self, courses: Iterable[Dict[str, Any]]):
+        self.rows: List[Dict[str, Any]] = list(courses)
+        self.subject_names: List[str] = []
+        self.group_names: List[str] = []
+        self._subject_code: Dict[str, int] = {}
+        self._group_code: Dict[str, int] = {}
+
+        self.subject_codes = array("h")
+        self.grades = array("h")
+        self.group_codes = array("h")
+        self.periods = array("h")
+        self.student_counts = array("h")
+        self.student_hours = array("i")
+
+        self._by_key: Dict[Tuple[int, int, int], List[int]] = defaultdict(list)
+        self._by_subject: Dict[int, List[int]] = defaultdict(list)
+        self._id_of: Dict[int, int] = {}
+
+        for course_id, course in enumerate(self.rows):
+            subject = self._encode(course["課程名稱"], self._subject_code, self.subject_names)
+            group = self._encode(course["組別"], self._group_code, self.group_names)
+
+            self.subject_codes.append(subject)
+            self.grades.append(course["年級"])
+            self.group_codes.append(group)
+            self.periods.append(course["節數"])
+            self.student_counts.append(course["人數"])
+            self.student_hours.append(course["人次"])
+
+            self._by_key[(subject, course["年級"], group)].append(course_id)
+            self._by_subject[subject].append(course_id)
+            self._id_of[id(course)] = course_id
+
+    @staticmethod
+    def _encode(name: str, codes: Dict[str, int], names: List[str]) -> int:
+        """將名稱編成整數代碼"""
+        if name not in codes:
+            codes[name] = len(names)
+            names.append(name)
+        return codes[name]
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(self.rows)
+
+    def __getitem__(self, course_id: int) -> Dict[str, Any]:
+        return self.rows[course_id]
+
+    def course_id(self, course: Dict[str, Any]) -> Optional[int]:
+        """取得課程的整數編號，不屬於此表的課程回傳 None"""
+        return self._id_of.get(id(course))
+
+    def subject_code(self, subject: str) -> Optional[int]:
+        """取得科目的整數代碼"""
+        return self._subject_code.get(subject)
+
+    def ids_of(self, *subjects: str) -> List[int]:
+        """依課表順序列出指定科目的課程編號"""
+        codes = [self._subject_code[s] for s in subjects if s in self._subject_code]
+        if len(codes) == 1:
+            return list(self._by_subject[codes[0]])
+        return sorted(i for code in codes for i in self._by_subject[code])
+
+    def of_subject(self, *subjects: str) -> List[Dict[str, Any]]:
+        """依課表順序列出指定科目的課程"""
+        return [self.rows[i] for i in self.ids_of(*subjects)]
+
+    def find(self, subject: str, grade: int, group: str) -> Dict[str, Any]:
+        """以 (科目, 年級, 組別) 找出課程"""
+        key = (self._subject_code.get(subject), grade, self._group_code.get(group))
+        ids = self._by_key.get(key)
+        if not ids:
+            raise ValueError(f"找不到指定課程：{subject} {grade}年級 {group}")
+        return self.rows[ids[0]]
+
+
+# 以 list 傳入的課表只轉換一次（同時保留原 list 的參照，避免 id 被重複使用）
+_tables: Dict[int, Tuple[list, CourseTable]] = {}
+_MAX_CACHED_TABLES = 16
+
+
+def _same_rows(table: CourseTable, courses: list) -> bool:
+    """快取的課表是否仍與 list 的內容相同（逐一比對課程物件本身，list 被原地修改時即不同）"""
+    return len(table.rows) == len(courses) and all(map(is_, table.rows, courses))
+
+
+def as_course_table(courses) -> CourseTable:
+    """將課程列表轉為 CourseTable（已是 CourseTable 時直接回傳）
+
+    同一個 list 只轉換一次；list 的元素被替換、增減時重新轉換。課程 dict 本身視為不可變。
+    """
+    if isinstance(courses, CourseTable):
+        return courses
+    entry = _tables.get(id(courses))
+    if entry is None or entry[0] is not courses or not _same_rows(entry[1], courses):
+        entry = (courses, CourseTable(courses))
+        if len(_tables) >= _MAX_CACHED_TABLES:
+            _tables.pop(next(iter(_tables)))
+        _tables[id(courses)] = entry
+    return entry[1]
@@ -0,0 +1,378 @@
+# cp_solver.py
+# 國數分配的純 Python 求解器：位元遮罩定義域 + 約束傳播 + 分支定界。
+# 求解的問題與 course_allocator.ChineseMathModel 相同：每堂尚未分配的課分給一位老師、
+# 每位老師剛好補滿剩餘節數、同年級同組別不同科目不可同一人、需補國語／數學的老師要分到該科，
+# 備課組差異不超過上限，並最小化 人次差異 + 權重 × 備課組差異。
+import time
+
+from subset_sum import CHINESE, MATH
+
+# 與 PuLP 相同的狀態碼
+STATUS_OPTIMAL = 1
+STATUS_NOT_SOLVED = 0
+STATUS_INFEASIBLE = -1
+
+# 每展開幾個節點檢查一次時間
+TIME_CHECK_INTERVAL = 256
+
+# 浮點目標值比較的容許誤差
+EPSILON = 1e-9
+
+
+class _Timeout(Exception):
+    pass
+
+
+def popcount(mask):
+    return bin(mask).count("1")
+
+
+def bits(mask):
+    """依序列出遮罩中為 1 的位元位置"""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class ChineseMathCP:
+    """國數分配的約束傳播 + 分支定界求解器
+
+    每份課表建立一次（課程的節數、人次、科目旗標、備課組別與衝堂關係），
+    solve() 再依本次嘗試的參數求解。每堂課的定義域是老師的位元遮罩：
+    剩餘節數放得下的老師，扣掉已拿到同組其他科目的老師。
+    分支時先分只剩一位老師可選的課，其餘先分節數、人次大的課，狀態相同的老師只試一位，
+    各分支依目標值下界由小到大搜尋。下界以每位老師的 (節數, 人次) bitset 逐備課組合併，
+    得到剛好補滿剩餘節數時可能的 (備課組數, 人次)，再加上國語／數學覆蓋與
+    人次、備課組總數的限制；下界不低於目前最佳解就剪枝。
+    """
+
+    def __init__(self, courses):
+        self.courses = list(courses)
+        self.periods = [c["節數"] for c in self.courses]
+        self.hours = [c["人次"] for c in self.courses]
+        self.flags = [CHINESE if c["課程名稱"] == "國語" else MATH for c in self.courses]
+
+        prep_keys = {}
+        self.prep_key = [prep_keys.setdefault((c["課程名稱"], c["年級"]), len(prep_keys)) for c in self.courses]
+        self.cell = [(c["年級"], c["組別"], c["課程名稱"]) for c in self.courses]
+        # 同年級同組別不同科目的課
+        self.conflicts = [
+            [j for j, other in enumerate(self.courses)
+             if other["年級"] == c["年級"] and other["組別"] == c["組別"] and other["課程名稱"] != c["課程名稱"]]
+            for c in self.courses
+        ]
+        self.nodes = 0
+
+    def solve(self, teachers, remaining, remaining_lessons, current_student_hours, special_prep_groups,
+              coverage=None, groups_weight=1, groups_limit=None, time_limit=None, gap=None):
+        """求解一次國數分配
+
+        參數與 ChineseMathModel.update() 相同，另加目標權重與備課組差異上限。
+        回傳 (狀態碼, {老師: [課程位置, ...]} 或 None, 是否已證明最佳)；
+        time_limit 用完時回傳目前最佳解（沒有則為 STATUS_NOT_SOLVED），
+        gap 為相對誤差，允許提前剪掉與最佳解差距在此比例內的分支。
+        """
+        teachers = list(teachers)
+        n = len(teachers)
+        remaining = sorted(remaining)
+        periods, hours, flags = self.periods, self.hours, self.flags
+        prep_key, conflicts, cell_of = self.prep_key, self.conflicts, self.cell
+
+        cap = [remaining_lessons[t] for t in teachers]
+        hrs = [current_student_hours[t] for t in teachers]
+        groups = [special_prep_groups[t] for t in teachers]
+        need = []
+        for t in teachers:
+            need_chinese, need_math = coverage[t] if coverage is not None else (False, False)
+            need.append((CHINESE if need_chinese else 0) | (MATH if need_math else 0))
+
+        if sum(cap) != sum(periods[i] for i in remaining) or min(cap, default=0) < 0:
+            return STATUS_INFEASIBLE, None, True
+
+        flag_count = [[0, 0, 0] for _ in range(n)]
+        prep_count = [{} for _ in range(n)]
+        cells = [{} for _ in range(n)]
+        # 衝堂：block_count[i][k] 為老師 k 已拿到幾堂與課 i 同組不同科的課，block_mask[i] 為其遮罩
+        block_count = {i: [0] * n for i in remaining}
+        block_mask = {i: 0 for i in remaining}
+        assigned = [[] for _ in range(n)]
+        unassigned = set(remaining)
+
+        deadline = time.perf_counter() + time_limit if time_limit is not None else None
+        best = [float("inf"), None]
+        self.nodes = 0
+
+        def signature(k):
+            """老師 k 的狀態（狀態相同的老師可互換）"""
+            return (cap[k], hrs[k], groups[k], missing(k), frozenset(prep_count[k]), frozenset(cells[k]))
+
+        def missing(k):
+            """老師 k 還需要補的科目旗標"""
+            return need[k] & ~((CHINESE if flag_count[k][CHINESE] else 0) | (MATH if flag_count[k][MATH] else 0))
+
+        def domains():
+            """每堂未分配課程的定義域（老師遮罩）"""
+            fits = {}
+            result = {}
+            for i in unassigned:
+                p = periods[i]
+                if p not in fits:
+                    fits[p] = sum(1 << k for k in range(n) if cap[k] >= p)
+                result[i] = fits[p] & ~block_mask[i]
+            return result
+
+        # (節數, 人次) 組合的 bitset：第 s * width + h 個位元表示可用 s 節湊出 h 人次
+        width = sum(hours[i] for i in remaining) + 1
+        row = (1 << width) - 1
+
+        # 所有老師最後的人次總和固定
+        total_hours = sum(hrs) + sum(hours[i] for i in remaining)
+
+        option_memo = {}
+
+        def options(k, key_sums):
+            """老師 k 剛好補滿剩餘節數時，新增 j 個備課組可增加的人次 bitset（依 j 排列）
+
+            key_sums 為各備課組別的課可湊出的 (節數, 人次) bitset，逐組合併：
+            已有的組別不增加組數，新的組別至少要拿一堂才算一組。
+            """
+            memo_key = (cap[k], frozenset(prep_count[k]), frozenset(key_sums.items()))
+            if memo_key not in option_memo:
+                full = (1 << ((cap[k] + 1) * width)) - 1
+                rows = [1]
+                for key, sums in key_sums.items():
+                    cost = 0 if key in prep_count[k] else 1
+                    updated = rows + [0] * cost
+                    for j, reach in enumerate(rows):
+                        if reach:
+                            combined = 0
+                            for s in bits(sums & ~1):
+                                combined |= reach << s
+                            updated[j + cost] |= combined & full
+                    rows = updated
+                option_memo[memo_key] = [(reach >> (cap[k] * width)) & row for reach in rows]
+            return option_memo[memo_key]
+
+        def hours_spread(finals, limit):
+            """各老師最終人次集合下的人次差異下界，不可行時回傳 None
+
+            差異 d 可行的必要條件是存在區間 [L, L + d] 與每位老師的集合都有交集，
+            且人次總和介於各交集最小值總和與最大值總和之間；由小到大找第一個可行的 d，
+            達到 limit 時直接回傳。
+            """
+            low_end = max((final & -final).bit_length() - 1 for final in finals)
+            high_end = min(final.bit_length() - 1 for final in finals)
+            widest = max(final.bit_length() for final in finals) - 1 - min((final & -final).bit_length() - 1 for final in finals)
+            for spread in range(max(0, low_end - high_end), widest + 1):
+                if spread >= limit:
+                    return spread
+                window = (1 << (spread + 1)) - 1
+                for low in range(max(0, low_end - spread), high_end + 1):
+                    low_sum = high_sum = 0
+                    for final in finals:
+                        hit = final & (window << low)
+                        if not hit:
+                            break
+                        low_sum += (hit & -hit).bit_length() - 1
+                        high_sum += hit.bit_length() - 1
+                    else:
+                        if low_sum <= total_hours <= high_sum:
+                            return spread
+            return None
+
+        def teacher_sums(domain, wanted):
+            """遮罩 wanted 中每位老師以定義域含他的課可湊出的各備課組別 (節數, 人次) bitset 與科目旗標
+
+            回傳 ({老師: {備課組別: bitset}}, {老師: 科目旗標})。
+            """
+            key_sums = {k: {} for k in bits(wanted)}
+            has = dict.fromkeys(key_sums, 0)
+            limits = {k: (1 << ((cap[k] + 1) * width)) - 1 for k in key_sums}
+            for i, mask in domain.items():
+                shift = periods[i] * width + hours[i]
+                key = prep_key[i]
+                for k in bits(mask & wanted):
+                    has[k] |= flags[i]
+                    sums = key_sums[k].get(key, 1)
+                    key_sums[k][key] = (sums | (sums << shift)) & limits[k]
+            return key_sums, has
+
+        def bound(domain, limit, key_sums, has):
+            """剩餘節數與國數覆蓋的可行性檢查，可行時回傳目標值下界，不可行時回傳 None
+
+            key_sums、has 為 teacher_sums() 對所有老師的結果。每位老師以此算出剛好補滿剩餘節數時
+            可能的 (最終備課組數, 最終人次)。對每個備課組差異 g 與組數區間 [G, G + g]，
+            只保留組數落在區間內的人次，再求人次差異下界；下界為各組合中
+            人次差異 + 權重 × g 的最小值，達到 limit 時提前結束（已可剪枝）。
+            """
+            if not all(domain.values()):
+                return None
+
+            # by_groups[k] 為 {最終備課組數: 最終人次 bitset}；還沒拿到的科目各需一個新的備課組
+            by_groups = []
+            for k in range(n):
+                lacking = missing(k)
+                if lacking & ~has[k]:
+                    return None
+                fewest = popcount(lacking)
+                choices = {groups[k] + j: added << hrs[k]
+                           for j, added in enumerate(options(k, key_sums[k])) if added and j >= fewest}
+                if not choices:
+                    return None
+                by_groups.append(choices)
+
+            # 新增備課組總數：沒有老師有的組別至少一組；每個組別最多新增
+            # min(該組未分配的課數, 還沒有該組的老師數) 組
+            pending = {}
+            for i in domain:
+                pending[prep_key[i]] = pending.get(prep_key[i], 0) + 1
+            fewest_new = most_new = 0
+            for key, count in pending.items():
+                holders = sum(key in held for held in prep_count)
+                fewest_new += not holders
+                most_new += min(count, n - holders)
+
+            groups_low = max(min(choices) for choices in by_groups)
+            groups_high = min(max(choices) for choices in by_groups)
+            widest = max(max(choices) for choices in by_groups) - min(min(choices) for choices in by_groups)
+            if groups_limit is not None:
+                widest = min(widest, groups_limit)
+
+            lowest = None
+            for spread in range(max(0, groups_low - groups_high), widest + 1):
+                base = groups_weight * spread
+                ceiling = limit if lowest is None else min(limit, lowest)
+                if base >= ceiling:
+                    return lowest if lowest is not None else base
+                for low in range(max(0, groups_low - spread), groups_high + 1):
+                    finals = []
+                    low_new = high_new = 0
+                    for k, choices in enumerate(by_groups):
+                        final = 0
+                        inside = [g for g in range(low, low + spread + 1) if g in choices]
+                        if not inside:
+                            break
+                        for g in inside:
+                            final |= choices[g]
+                        finals.append(final)
+                        low_new += inside[0] - groups[k]
+                        high_new += inside[-1] - groups[k]
+                    else:
+                        if not low_new <= most_new or not fewest_new <= high_new:
+                            continue
+                        extra = hours_spread(finals, ceiling - base)
+                        if extra is not None and (lowest is None or base + extra < lowest):
+                            lowest = base + extra
+                            ceiling = min(limit, lowest)
+            return lowest
+
+        def assign(i, k, sign):
+            cap[k] -= sign * periods[i]
+            hrs[k] += sign * hours[i]
+            flag_count[k][flags[i]] += sign
+            key = prep_key[i]
+            count = prep_count[k].get(key, 0) + sign
+            if count:
+                prep_count[k][key] = count
+            else:
+                del prep_count[k][key]
+            groups[k] += (count > 0) - (count - sign > 0)
+            cell = cell_of[i]
+            count = cells[k].get(cell, 0) + sign
+            if count:
+                cells[k][cell] = count
+            else:
+                del cells[k][cell]
+            for j in conflicts[i]:
+                if j in block_count:
+                    block_count[j][k] += sign
+                    if block_count[j][k]:
+                        block_mask[j] |= 1 << k
+                    else:
+                        block_mask[j] &= ~(1 << k)
+            if sign > 0:
+                unassigned.discard(i)
+                assigned[k].append(i)
+            else:
+                unassigned.add(i)
+                assigned[k].pop()
+
+        def limit():
+            """下界需低於此值才值得搜尋"""
+            slack = gap * abs(best[0]) if gap and best[1] is not None else 0
+            return best[0] - EPSILON - slack
+
+        def complete():
+            """全部分完時記錄解（節數總和不變，每位老師的剩餘節數必為 0）"""
+            if any(missing(k) for k in range(n)):
+                return
+            groups_spread = max(groups) - min(groups)
+            if groups_limit is not None and groups_spread > groups_limit:
+                return
+            objective = max(hrs) - min(hrs) + groups_weight * groups_spread
+            if objective < best[0] - EPSILON:
+                best[0] = objective
+                best[1] = [list(a) for a in assigned]
+
+        def search(domain):
+            self.nodes += 1
+            if deadline is not None and self.nodes % TIME_CHECK_INTERVAL == 0 and time.perf_counter() > deadline:
+                raise _Timeout
+
+            # 只剩一位老師可選的課先分，其餘先分節數、人次大的課（最難放進剩餘節數）
+            i = min(domain, key=lambda i: (popcount(domain[i]) > 1, -periods[i], -hours[i], i))
+
+            # 分支之間只有拿到課 i 的老師狀態不同：其他老師扣掉課 i 的 bitset 每個節點只算一次，
+            # 各分支只重算拿到課 i 的老師
+            rest = {j: mask for j, mask in domain.items() if j != i}
+            shared_sums, shared_has = teacher_sums(rest, (1 << n) - 1)
+
+            # 先算出每個分支的定義域與下界，再由下界小的分支開始搜尋
+            children = []
+            tried = set()
+            for order, k in enumerate(sorted(bits(domain[i]), key=lambda k: (hrs[k] + hours[i], k))):
+                # 狀態完全相同的老師可互換，只需嘗試其中一位
+                state_k = signature(k)
+                if state_k in tried:
+                    continue
+                tried.add(state_k)
+                assign(i, k, 1)
+                if unassigned:
+                    child = domains()
+                    own_sums, own_has = teacher_sums(child, 1 << k)
+                    lower = bound(child, limit(), {**shared_sums, **own_sums}, {**shared_has, **own_has})
+                    if lower is not None and lower < limit():
+                        children.append((lower, order, k, child))
+                else:
+                    complete()
+                assign(i, k, -1)
+
+            children.sort(key=lambda child: child[:2])
+            for lower, _, k, child in children:
+                if lower >= limit():
+                    break
+                assign(i, k, 1)
+                search(child)
+                assign(i, k, -1)
+
+        try:
+            if unassigned:
+                domain = domains()
+                lower = bound(domain, limit(), *teacher_sums(domain, (1 << n) - 1))
+                if lower is not None:
+                    search(domain)
+            else:
+                complete()
+        except _Timeout:
+            if best[1] is None:
+                return STATUS_NOT_SOLVED, None, False
+            return STATUS_OPTIMAL, self._result(teachers, best[1]), False
+
+        if best[1] is None:
+            return STATUS_INFEASIBLE, None, True
+        return STATUS_OPTIMAL, self._result(teachers, best[1]), not gap
+
+    @staticmethod
+    def _result(teachers, assignment):
+        return {t: sorted(a) for t, a in zip(teachers, assignment)}
@@ -1,13 +1,21 @@
 # data_handler.py
 import csv
 import os
+import posixpath
+import re
+import shutil
+import zipfile
 from datetime import datetime
+from xml.sax.saxutils import escape, quoteattr, unescape
 import openpyxl
+from openpyxl.utils import get_column_letter
+import config
 
-def save_to_csv(solution):
+def save_to_csv(solution, save_path=None):
     """將分配結果保存為CSV文件"""
     # 指定儲存路徑
-    save_path = r"C:\Users\USER\OneDrive\桌面"
+    if save_path is None:
+        save_path = r"C:\Users\USER\OneDrive\桌面"
     
     # 生成檔案名稱，包含時間戳
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -51,21 +59,17 @@ def save_to_csv(solution):
     
     print(f"\n分配結果已保存至 {full_path}")
 
-def update_excel_with_solution(solution, excel_path):
-    """將分配結果更新到Excel"""
-    wb = openpyxl.load_workbook(excel_path)
-    
-    # 建立新工作表
-    result_sheet = wb.create_sheet(f"配課結果_{datetime.now().strftime('%m%d_%H%M')}")
-    
-    # 設定標題行
-    headers = ['老師', '年級', '課程名稱', '組別', '節數', '人數', '人次', 
-              '備課組別', '總節數', '總人次']
-    for col, header in enumerate(headers, 1):
-        result_sheet.cell(row=1, column=col, value=header)
-    
-    # 寫入課程資料
-    current_row = 2
+# 結果工作表的標題列
+RESULT_HEADERS = ['老師', '年級', '課程名稱', '組別', '節數', '人數', '人次',
+                  '備課組別', '總節數', '總人次']
+
+# 修補模式每次寫入 zip 的列數
+ROW_BATCH_SIZE = 500
+
+
+def result_rows(solution):
+    """依序產生結果工作表的每一列（空白分隔列為 None）"""
+    yield RESULT_HEADERS
     for teacher, load in solution.items():
         # 計算備課組別
         special_groups = len([c for c in load["課程"] 
@@ -73,33 +77,191 @@ def update_excel_with_solution(solution, excel_path):
         chinese_math_groups = len(set(f"{c['課程名稱']}_{c['年級']}" 
                                     for c in load["課程"] 
                                     if c["課程名稱"] in ["國語", "數學"]))
-        
-        # 寫入每門課程
+
+        # 每門課程一列
         for course in sorted(load['課程'], 
                            key=lambda x: (x['課程名稱'], x['年級'], x['組別'])):
-            result_sheet.cell(row=current_row, column=1, value=teacher)
-            result_sheet.cell(row=current_row, column=2, value=course['年級'])
-            result_sheet.cell(row=current_row, column=3, value=course['課程名稱'])
-            result_sheet.cell(row=current_row, column=4, value=course['組別'])
-            result_sheet.cell(row=current_row, column=5, value=course['節數'])
-            result_sheet.cell(row=current_row, column=6, value=course['人數'])
-            result_sheet.cell(row=current_row, column=7, value=course['人次'])
-            current_row += 1
-        
-        # 寫入合計行
-        result_sheet.cell(row=current_row, column=1, value=f"{teacher}合計")
-        result_sheet.cell(row=current_row, column=8, 
-                         value=f"特需{special_groups}組 + 國數{chinese_math_groups}組")
-        result_sheet.cell(row=current_row, column=9, value=load['節數'])
-        result_sheet.cell(row=current_row, column=10, value=load['人次'])
-        
-        current_row += 2  # 空一行
-    
-    # 儲存新檔案
+            yield [teacher, course['年級'], course['課程名稱'], course['組別'],
+                   course['節數'], course['人數'], course['人次']]
+
+        # 合計行
+        yield [f"{teacher}合計", None, None, None, None, None, None,
+               f"特需{special_groups}組 + 國數{chinese_math_groups}組", load['節數'], load['人次']]
+        yield None  # 空一行
+
+
+def result_sheet_name():
+    return f"配課結果_{datetime.now().strftime('%m%d_%H%M')}"
+
+
+def result_path(excel_path):
+    """結果檔路徑：與原始檔同資料夾，檔名加上 _配課結果"""
     file_dir = os.path.dirname(excel_path)
-    file_name = os.path.basename(excel_path)
-    name, ext = os.path.splitext(file_name)
-    new_file_path = os.path.join(file_dir, f"{name}_配課結果{ext}")
+    name, ext = os.path.splitext(os.path.basename(excel_path))
+    return os.path.join(file_dir, f"{name}_配課結果{ext}")
+
+
+def update_excel_with_solution(solution, excel_path, mode=None):
+    """將分配結果更新到Excel
+
+    mode 未指定時依 config.EXCEL_EXPORT_MODE：
+    "copy" 載入整份原始活頁簿並加入結果工作表後另存（原本的做法）；
+    "separate" 以唯寫模式逐列寫出只含結果工作表的新檔；
+    "patch" 不載入原始活頁簿，逐項複製 xlsx 壓縮檔內容並直接加入結果工作表。
+    回傳結果檔路徑。
+    """
+    mode = mode or config.EXCEL_EXPORT_MODE
+    if mode == "separate":
+        new_file_path = write_result_workbook(solution, result_path(excel_path))
+    elif mode == "patch":
+        new_file_path = patch_result_sheet(solution, excel_path, result_path(excel_path))
+    elif mode == "copy":
+        new_file_path = copy_with_result_sheet(solution, excel_path)
+    else:
+        raise ValueError(f"未知的 Excel 匯出模式：{mode}")
+    print(f"\n分配結果已更新至 {new_file_path}")
+    return new_file_path
+
+
+def copy_with_result_sheet(solution, excel_path):
+    """載入整份原始活頁簿，加入結果工作表後另存"""
+    wb = openpyxl.load_workbook(excel_path)
+    
+    # 建立新工作表並整列寫入
+    result_sheet = wb.create_sheet(result_sheet_name())
+    for row in result_rows(solution):
+        result_sheet.append(row or [])
     
+    # 儲存新檔案
+    new_file_path = result_path(excel_path)
     wb.save(new_file_path)
-    print(f"\n分配結果已更新至 {new_file_path}")
\ No newline at end of file
+    return new_file_path
+
+
+def write_result_workbook(solution, path):
+    """以唯寫模式逐列寫出只含結果工作表的活頁簿"""
+    wb = openpyxl.Workbook(write_only=True)
+    result_sheet = wb.create_sheet(result_sheet_name())
+    for row in result_rows(solution):
+        result_sheet.append(row or [])
+    wb.save(path)
+    return path
+
+
+# xlsx 內部使用的命名空間與內容類型
+RELATIONSHIPS_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+WORKSHEET_TYPE = RELATIONSHIPS_NS + "/worksheet"
+WORKSHEET_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"
+
+
+def sheet_xml_rows(rows):
+    """將列轉為工作表 XML 的 <row> 片段（字串以 inlineStr 寫入，不需修改共用字串表）"""
+    for r, row in enumerate(rows, 1):
+        if not row:
+            continue
+        cells = []
+        for c, value in enumerate(row, 1):
+            if value is None:
+                continue
+            ref = f"{get_column_letter(c)}{r}"
+            if isinstance(value, (int, float)):
+                cells.append(f'<c r="{ref}"><v>{value}</v></c>')
+            else:
+                cells.append(f'<c r="{ref}" t="inlineStr"><is><t>{escape(str(value))}</t></is></c>')
+        yield f'<row r="{r}">{"".join(cells)}</row>'
+
+
+def patch_result_sheet(solution, excel_path, new_file_path, sheet_name=None):
+    """不載入原始活頁簿，直接在 xlsx 壓縮檔中加入結果工作表
+
+    其他項目原封不動地逐項複製；只修改 workbook.xml、其關聯檔與 [Content_Types].xml
+    這三個小檔案，並以批次寫入的方式串流產生新的工作表 XML。
+    """
+    sheet_name = sheet_name or result_sheet_name()
+    with zipfile.ZipFile(excel_path) as source:
+        names = source.namelist()
+        workbook_path = _office_document_path(source)
+        workbook_dir = posixpath.dirname(workbook_path)
+        rels_path = posixpath.join(workbook_dir, "_rels", posixpath.basename(workbook_path) + ".rels")
+
+        workbook_xml = source.read(workbook_path).decode("utf-8")
+        rels_xml = source.read(rels_path).decode("utf-8")
+        types_xml = source.read("[Content_Types].xml").decode("utf-8")
+
+        # 新工作表的檔名、關聯編號與工作表編號
+        k = 1
+        while posixpath.join(workbook_dir, f"worksheets/sheet{k}.xml") in names:
+            k += 1
+        sheet_path = posixpath.join(workbook_dir, f"worksheets/sheet{k}.xml")
+        rel_ids = set(re.findall(r'Id="([^"]+)"', rels_xml))
+        n = len(rel_ids) + 1
+        while f"rId{n}" in rel_ids:
+            n += 1
+        rel_id = f"rId{n}"
+        sheet_ids = [int(i) for i in re.findall(r'<(?:\w+:)?sheet\b[^>]*\bsheetId="(\d+)"', workbook_xml)]
+        sheet_id = max(sheet_ids, default=0) + 1
+
+        # 工作表名稱重複時加上編號
+        existing = set(unescape(name) for name in
+                       re.findall(r'<(?:\w+:)?sheet\b[^>]*\bname="([^"]*)"', workbook_xml))
+        base_name, suffix = sheet_name, 1
+        while sheet_name in existing:
+            sheet_name = f"{base_name} {suffix}"
+            suffix += 1
+
+        prefix = re.search(r'xmlns:(\w+)="' + re.escape(RELATIONSHIPS_NS) + '"', workbook_xml)
+        r_prefix = prefix.group(1) if prefix else "r"
+        if prefix is None:
+            workbook_xml = re.sub(r"<((?:\w+:)?workbook)\b", rf'<\1 xmlns:r="{RELATIONSHIPS_NS}"',
+                                  workbook_xml, count=1)
+        workbook_xml = re.sub(
+            r"</((?:\w+:)?sheets)>",
+            lambda m: f'<sheet name={quoteattr(sheet_name)} sheetId="{sheet_id}" '
+                      f'{r_prefix}:id="{rel_id}"/></{m.group(1)}>',
+            workbook_xml, count=1)
+        rels_xml = rels_xml.replace(
+            "</Relationships>",
+            f'<Relationship Id="{rel_id}" Type="{WORKSHEET_TYPE}" '
+            f'Target="worksheets/sheet{k}.xml"/></Relationships>')
+        types_xml = types_xml.replace(
+            "</Types>",
+            f'<Override PartName="/{sheet_path}" ContentType="{WORKSHEET_CONTENT_TYPE}"/></Types>')
+        patched = {workbook_path: workbook_xml, rels_path: rels_xml, "[Content_Types].xml": types_xml}
+
+        temp_path = f"{new_file_path}.tmp"
+        with zipfile.ZipFile(temp_path, "w", zipfile.ZIP_DEFLATED) as target:
+            for info in source.infolist():
+                # 另建 ZipInfo，避免寫入時改動到來源壓縮檔的項目資訊
+                entry = zipfile.ZipInfo(info.filename, info.date_time)
+                entry.compress_type = info.compress_type
+                entry.external_attr = info.external_attr
+                if info.filename in patched:
+                    target.writestr(entry, patched[info.filename].encode("utf-8"))
+                else:
+                    with source.open(info) as src, target.open(entry, "w") as dst:
+                        shutil.copyfileobj(src, dst)
+
+            with target.open(sheet_path, "w") as dst:
+                dst.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                          b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                          b'<sheetData>')
+                batch = []
+                for row_xml in sheet_xml_rows(result_rows(solution)):
+                    batch.append(row_xml)
+                    if len(batch) >= ROW_BATCH_SIZE:
+                        dst.write("".join(batch).encode("utf-8"))
+                        batch = []
+                dst.write("".join(batch).encode("utf-8"))
+                dst.write(b"</sheetData></worksheet>")
+    os.replace(temp_path, new_file_path)
+    return new_file_path
+
+
+def _office_document_path(archive):
+    """從 _rels/.rels 找出活頁簿 XML 在壓縮檔中的路徑"""
+    rels = archive.read("_rels/.rels").decode("utf-8")
+    for relationship in re.findall(r"<(?:\w+:)?Relationship\b[^>]*>", rels):
+        if relationship.find("/officeDocument\"") != -1:
+            target = re.search(r'Target="([^"]+)"', relationship).group(1)
+            return target.lstrip("/")
+    return "xl/workbook.xml"
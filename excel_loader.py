@@ -0,0 +1,206 @@
+# excel_loader.py
+import hashlib
+import json
+import os
+import re
+
+import config
+
+# 解析格式變更時遞增，讓舊的快取失效
+LOADER_VERSION = 1
+
+# 各欄位可接受的標題名稱
+HEADER_ALIASES = {
+    "年級": ("年級",),
+    "課程名稱": ("課程名稱", "課程", "領域", "科目", "課程領域"),
+    "組別": ("組別", "分組", "組"),
+    "節數": ("節數", "每週節數"),
+    "人數": ("人數", "學生數", "學生人數"),
+    "人次": ("人次",),
+}
+REQUIRED_FIELDS = ("年級", "課程名稱", "組別", "節數", "人數")
+
+# 只在前幾列尋找標題列
+HEADER_SEARCH_ROWS = 30
+
+# 本行程中已讀取的課表（同一份檔案重複呼叫時回傳同一個列表，讓 CourseTable 的快取生效）
+_loaded = {}
+
+CHINESE_DIGITS = {"一": 1, "二": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+
+
+def find_header(row):
+    """判斷一列是否為標題列，是的話回傳 {欄位: 欄位位置}，否則回傳 None"""
+    columns = {}
+    for k, cell in enumerate(row):
+        if cell is None:
+            continue
+        text = str(cell).strip().replace(" ", "").replace("\n", "")
+        for field, aliases in HEADER_ALIASES.items():
+            if field not in columns and text in aliases:
+                columns[field] = k
+                break
+    if all(field in columns for field in REQUIRED_FIELDS):
+        return columns
+    return None
+
+
+def parse_grade(value):
+    """將 4、"4"、"四年級" 之類的年級轉為整數，無法判斷時回傳 None"""
+    if isinstance(value, (int, float)):
+        return int(value)
+    text = str(value).strip()
+    match = re.search(r"\d+", text)
+    if match:
+        return int(match.group())
+    for char in text:
+        if char in CHINESE_DIGITS:
+            return CHINESE_DIGITS[char]
+    return None
+
+
+def parse_number(value):
+    """將儲存格數值轉為整數，空白或無法轉換時回傳 None"""
+    if value is None or value == "":
+        return None
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def iter_courses(rows):
+    """從逐列讀出的儲存格值產生課程 dict
+
+    先在前 HEADER_SEARCH_ROWS 列中找標題列，之後的每一列轉成一堂課；
+    合併儲存格在唯讀模式下只有第一格有值，因此年級與課程名稱空白時沿用上一列。
+    """
+    columns = None
+    last_grade = None
+    last_subject = None
+    for index, row in enumerate(rows):
+        if columns is None:
+            columns = find_header(row)
+            if columns is None and index >= HEADER_SEARCH_ROWS:
+                raise ValueError(f"前 {HEADER_SEARCH_ROWS} 列中找不到包含 {'、'.join(REQUIRED_FIELDS)} 的標題列")
+            continue
+
+        def cell(field):
+            k = columns.get(field)
+            return row[k] if k is not None and k < len(row) else None
+
+        periods = parse_number(cell("節數"))
+        students = parse_number(cell("人數"))
+        group = cell("組別")
+        if periods is None or students is None or group is None:
+            # 空白列、小計列等
+            continue
+
+        grade = parse_grade(cell("年級")) if cell("年級") is not None else last_grade
+        subject = str(cell("課程名稱")).strip() if cell("課程名稱") is not None else last_subject
+        if grade is None or not subject:
+            continue
+        last_grade, last_subject = grade, subject
+
+        student_hours = parse_number(cell("人次"))
+        yield {
+            "年級": grade,
+            "課程名稱": subject,
+            "組別": str(group).strip(),
+            "節數": periods,
+            "人數": students,
+            "人次": student_hours if student_hours is not None else periods * students,
+        }
+
+    if columns is None:
+        raise ValueError(f"找不到包含 {'、'.join(REQUIRED_FIELDS)} 的標題列")
+
+
+def parse_workbook(path, sheet=None):
+    """以唯讀模式逐列讀取工作表並解析課程（不會把整份活頁簿載入記憶體）"""
+    import openpyxl
+
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        ws = wb[sheet] if sheet is not None else wb.worksheets[0]
+        return list(iter_courses(ws.iter_rows(values_only=True)))
+    finally:
+        wb.close()
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """以固定大小的區塊計算檔案的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_file(path, sheet=None):
+    """課表檔對應的快取檔路徑"""
+    key = hashlib.sha256(f"{os.path.abspath(path)}|{sheet}".encode("utf-8")).hexdigest()[:32]
+    return os.path.join(config.CACHE_PATH, f"courses_{key}.json")
+
+
+def read_cache(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if cached.get("version") != LOADER_VERSION:
+        return None
+    return cached
+
+
+def write_cache(path, entry):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(entry, f, ensure_ascii=False)
+    os.replace(temp_path, path)
+
+
+def load_courses(path=None, sheet=None, use_cache=True):
+    """讀取課程領域分組及節數一覽表，回傳課程列表
+
+    解析結果以 JSON 快取在 config.CACHE_PATH。修改時間與檔案大小都相同時直接使用快取；
+    修改時間不同但內容雜湊相同（例如只是被複製或觸碰）時也不重新解析。
+    path、sheet 未指定時使用 config.EXCEL_PATH 與第一個工作表。
+    """
+    path = path or config.EXCEL_PATH
+    if not use_cache:
+        return parse_workbook(path, sheet)
+
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), sheet, stat.st_mtime_ns, stat.st_size)
+    if memo_key not in _loaded:
+        _loaded.clear()
+        _loaded[memo_key] = _load_cached(path, sheet, stat)
+    return _loaded[memo_key]
+
+
+def _load_cached(path, sheet, stat):
+    """從磁碟快取讀取課表，快取失效時重新解析並寫回"""
+    cache_path = cache_file(path, sheet)
+    cached = read_cache(cache_path)
+    if cached is not None and cached["mtime"] == stat.st_mtime_ns and cached["size"] == stat.st_size:
+        return cached["courses"]
+
+    digest = file_digest(path)
+    if cached is not None and cached["sha256"] == digest:
+        courses = cached["courses"]
+    else:
+        courses = parse_workbook(path, sheet)
+
+    write_cache(cache_path, {
+        "version": LOADER_VERSION,
+        "path": os.path.abspath(path),
+        "sheet": sheet,
+        "mtime": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "sha256": digest,
+        "courses": courses,
+    })
+    return courses
@@ -1,86 +1,242 @@
 # fet_converter.py
 import csv
 import os
+import shutil
+import tempfile
 from datetime import datetime
+from xml.sax.saxutils import XMLGenerator
 
-def convert_to_fet_format(solution, output_dir=None):
-    """將分配結果轉換為FET可匯入的CSV格式"""
+import config
+
+# 星期名稱（依 config.FET_DAYS 取前幾天）
+DAY_NAMES = ["星期一", "星期二", "星期三", "星期四", "星期五", "星期六", "星期日"]
+
+
+def group_name(course):
+    return f"{course['年級']}年級{course['組別']}"
+
+
+def year_name(course):
+    return f"{course['年級']}年級"
+
+
+class FetData:
+    """一次走訪分配結果收集 FET 需要的資料
+
+    老師、科目依出現順序記錄；每個學生組別的人數取該組各課程人數的最大值。
+    活動在走訪時就以 on_activity(序號, 老師, 課程) 交出（序號從 1 起、每堂課一號），
+    不另外保存整份活動列表。
+    """
+
+    def __init__(self):
+        self.teachers = []
+        self.subjects = {}
+        self.years = {}
+        self.activities = 0
+
+    def collect(self, solution, on_activity):
+        for teacher, load in solution.items():
+            self.teachers.append(teacher)
+            for course in sorted(load['課程'], key=lambda x: (x['課程名稱'], x['年級'], x['組別'])):
+                self.subjects.setdefault(course['課程名稱'], None)
+                groups = self.years.setdefault(year_name(course), {})
+                name = group_name(course)
+                groups[name] = max(groups.get(name, 0), course['人數'])
+
+                self.activities += 1
+                on_activity(self.activities, teacher, course)
+        return self
+
+
+def convert_to_fet_format(solution, output_dir=None, fmt=None):
+    """將分配結果轉換為 FET 格式
+
+    fmt 未指定時依 config.FET_EXPORT_FORMAT："fet" 產生可直接開啟的 .fet 檔，
+    "csv" 產生教師、科目、學生與活動四個 CSV 檔。
+    """
     if output_dir is None:
         output_dir = os.path.join(os.getcwd(), "fet_export")
     os.makedirs(output_dir, exist_ok=True)
-    
+
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    
-    # 1. 生成教師CSV
-    create_teachers_csv(solution, output_dir, timestamp)
-    
-    # 2. 生成科目CSV
-    create_subjects_csv(solution, output_dir, timestamp)
-    
-    # 3. 生成學生/年級組別CSV
-    create_students_csv(solution, output_dir, timestamp)
-    
-    # 4. 生成活動CSV
-    create_activities_csv(solution, output_dir, timestamp)
-    
+    fmt = fmt or config.FET_EXPORT_FORMAT
+    if fmt == "fet":
+        path = write_fet_file(solution, os.path.join(output_dir, f"course_allocation_{timestamp}.fet"))
+        print(f"\nFET檔案已生成：{path}")
+        return path
+    if fmt != "csv":
+        raise ValueError(f"未知的 FET 匯出格式：{fmt}")
+
+    write_fet_csv(solution, output_dir, timestamp)
     print(f"\nFET格式檔案已生成於 {output_dir} 資料夾中")
+    return output_dir
+
+
+def _text_element(xml, name, value, indent):
+    xml.ignorableWhitespace(indent)
+    xml.startElement(name, {})
+    xml.characters(str(value))
+    xml.endElement(name)
+    xml.ignorableWhitespace("\n")
+
+
+def _start(xml, name, indent=""):
+    xml.ignorableWhitespace(indent)
+    xml.startElement(name, {})
+    xml.ignorableWhitespace("\n")
+
+
+def _end(xml, name, indent=""):
+    xml.ignorableWhitespace(indent)
+    xml.endElement(name)
+    xml.ignorableWhitespace("\n")
+
+
+def write_fet_file(solution, path, institution=None):
+    """以一次走訪收集資料，並以串流方式寫出 FET 的 .fet XML 檔
 
-def create_teachers_csv(solution, output_dir, timestamp):
-    """生成教師CSV"""
-    filepath = os.path.join(output_dir, f'teachers_{timestamp}.csv')
-    with open(filepath, 'w', newline='', encoding='utf-8-sig') as f:
+    每堂課拆成節數個 1 節的子活動，Id 依序連續編號，共用同一個 Activity_Group_Id（即第一個子活動的 Id），
+    活動 XML 在走訪時先寫入暫存檔，最後接在老師、科目、學生清單之後，
+    因此記憶體用量不隨活動數增加。
+    """
+    with tempfile.TemporaryFile("w+", encoding="utf-8") as activities_file:
+        activities_xml = XMLGenerator(activities_file, encoding="utf-8", short_empty_elements=True)
+
+        next_id = 1
+
+        def write_activity(_, teacher, course):
+            nonlocal next_id
+            first_id = next_id
+            total = course['節數']
+            next_id += total
+            for k in range(total):
+                _start(activities_xml, "Activity", "\t")
+                _text_element(activities_xml, "Teacher", teacher, "\t\t")
+                _text_element(activities_xml, "Subject", course['課程名稱'], "\t\t")
+                _text_element(activities_xml, "Students", group_name(course), "\t\t")
+                _text_element(activities_xml, "Duration", 1, "\t\t")
+                _text_element(activities_xml, "Total_Duration", total, "\t\t")
+                _text_element(activities_xml, "Id", first_id + k, "\t\t")
+                _text_element(activities_xml, "Activity_Group_Id", first_id if total > 1 else 0, "\t\t")
+                _text_element(activities_xml, "Active", "true", "\t\t")
+                _text_element(activities_xml, "Comments", "", "\t\t")
+                _end(activities_xml, "Activity", "\t")
+
+        data = FetData().collect(solution, write_activity)
+
+        with open(path, "w", encoding="utf-8") as f:
+            xml = XMLGenerator(f, encoding="utf-8", short_empty_elements=True)
+            xml.startDocument()
+            xml.startElement("fet", {"version": config.FET_VERSION})
+            xml.ignorableWhitespace("\n")
+            _text_element(xml, "Institution_Name", institution or config.FET_INSTITUTION, "")
+            _text_element(xml, "Comments", "", "")
+
+            _start(xml, "Days_List")
+            _text_element(xml, "Number_of_Days", config.FET_DAYS, "\t")
+            for day in DAY_NAMES[:config.FET_DAYS]:
+                _start(xml, "Day", "\t")
+                _text_element(xml, "Name", day, "\t\t")
+                _end(xml, "Day", "\t")
+            _end(xml, "Days_List")
+
+            _start(xml, "Hours_List")
+            _text_element(xml, "Number_of_Hours", config.FET_HOURS_PER_DAY, "\t")
+            for hour in range(1, config.FET_HOURS_PER_DAY + 1):
+                _start(xml, "Hour", "\t")
+                _text_element(xml, "Name", f"第{hour}節", "\t\t")
+                _end(xml, "Hour", "\t")
+            _end(xml, "Hours_List")
+
+            _start(xml, "Subjects_List")
+            for subject in data.subjects:
+                _start(xml, "Subject", "\t")
+                _text_element(xml, "Name", subject, "\t\t")
+                _text_element(xml, "Comments", "", "\t\t")
+                _end(xml, "Subject", "\t")
+            _end(xml, "Subjects_List")
+
+            _start(xml, "Activity_Tags_List")
+            _end(xml, "Activity_Tags_List")
+
+            _start(xml, "Teachers_List")
+            for teacher in data.teachers:
+                _start(xml, "Teacher", "\t")
+                _text_element(xml, "Name", teacher, "\t\t")
+                _text_element(xml, "Target_Number_of_Hours", 0, "\t\t")
+                _start(xml, "Qualified_Subjects", "\t\t")
+                _end(xml, "Qualified_Subjects", "\t\t")
+                _text_element(xml, "Comments", "", "\t\t")
+                _end(xml, "Teacher", "\t")
+            _end(xml, "Teachers_List")
+
+            # 學生：年級底下為各組，年級人數以各組人數加總估計
+            _start(xml, "Students_List")
+            for year in sorted(data.years, key=lambda name: int(name[:-2])):
+                groups = data.years[year]
+                _start(xml, "Year", "\t")
+                _text_element(xml, "Name", year, "\t\t")
+                _text_element(xml, "Number_of_Students", sum(groups.values()), "\t\t")
+                _text_element(xml, "Comments", "", "\t\t")
+                for name in sorted(groups):
+                    _start(xml, "Group", "\t\t")
+                    _text_element(xml, "Name", name, "\t\t\t")
+                    _text_element(xml, "Number_of_Students", groups[name], "\t\t\t")
+                    _text_element(xml, "Comments", "", "\t\t\t")
+                    _end(xml, "Group", "\t\t")
+                _end(xml, "Year", "\t")
+            _end(xml, "Students_List")
+
+            _start(xml, "Activities_List")
+            f.flush()
+            activities_file.seek(0)
+            shutil.copyfileobj(activities_file, f)
+            _end(xml, "Activities_List")
+
+            _start(xml, "Buildings_List")
+            _end(xml, "Buildings_List")
+            _start(xml, "Rooms_List")
+            _end(xml, "Rooms_List")
+
+            for constraints, basic in (("Time_Constraints_List", "ConstraintBasicCompulsoryTime"),
+                                       ("Space_Constraints_List", "ConstraintBasicCompulsorySpace")):
+                _start(xml, constraints)
+                _start(xml, basic, "\t")
+                _text_element(xml, "Weight_Percentage", 100, "\t\t")
+                _text_element(xml, "Active", "true", "\t\t")
+                _text_element(xml, "Comments", "", "\t\t")
+                _end(xml, basic, "\t")
+                _end(xml, constraints)
+
+            xml.endElement("fet")
+            xml.ignorableWhitespace("\n")
+            xml.endDocument()
+    return path
+
+
+def write_fet_csv(solution, output_dir, timestamp):
+    """以一次走訪收集資料，寫出教師、科目、學生與活動四個 CSV 檔"""
+    activities_path = os.path.join(output_dir, f'activities_{timestamp}.csv')
+    with open(activities_path, 'w', newline='', encoding='utf-8-sig') as f:
         writer = csv.writer(f)
-        writer.writerow(['Name'])
-        for teacher in solution.keys():
-            writer.writerow([teacher])
-
-def create_subjects_csv(solution, output_dir, timestamp):
-    """生成科目CSV"""
-    subjects = set()
-    for load in solution.values():
-        for course in load['課程']:
-            subjects.add(course['課程名稱'])
-    
-    filepath = os.path.join(output_dir, f'subjects_{timestamp}.csv')
-    with open(filepath, 'w', newline='', encoding='utf-8-sig') as f:
+        writer.writerow(['Activity_Id', 'Subject', 'Teacher', 'Students',
+                        'Duration', 'Total_Duration', 'Active'])
+        data = FetData().collect(solution, lambda activity_id, teacher, course: writer.writerow([
+            activity_id, course['課程名稱'], teacher, group_name(course),
+            course['節數'], course['節數'], 'true']))
+
+    with open(os.path.join(output_dir, f'teachers_{timestamp}.csv'), 'w', newline='', encoding='utf-8-sig') as f:
         writer = csv.writer(f)
         writer.writerow(['Name'])
-        for subject in sorted(subjects):
-            writer.writerow([subject])
-
-def create_students_csv(solution, output_dir, timestamp):
-    """生成學生/年級組別CSV"""
-    groups = set()
-    for load in solution.values():
-        for course in load['課程']:
-            groups.add(f"{course['年級']}年級{course['組別']}")
-    
-    filepath = os.path.join(output_dir, f'students_{timestamp}.csv')
-    with open(filepath, 'w', newline='', encoding='utf-8-sig') as f:
+        writer.writerows([teacher] for teacher in data.teachers)
+
+    with open(os.path.join(output_dir, f'subjects_{timestamp}.csv'), 'w', newline='', encoding='utf-8-sig') as f:
         writer = csv.writer(f)
-        writer.writerow(['Year', 'Number_of_Students'])
-        for group in sorted(groups):
-            writer.writerow([group, 30])  # 假設每組30人
+        writer.writerow(['Name'])
+        writer.writerows([subject] for subject in sorted(data.subjects))
 
-def create_activities_csv(solution, output_dir, timestamp):
-    """生成活動CSV"""
-    filepath = os.path.join(output_dir, f'activities_{timestamp}.csv')
-    with open(filepath, 'w', newline='', encoding='utf-8-sig') as f:
+    with open(os.path.join(output_dir, f'students_{timestamp}.csv'), 'w', newline='', encoding='utf-8-sig') as f:
         writer = csv.writer(f)
-        writer.writerow(['Activity_Id', 'Subject', 'Teacher', 'Students', 
-                        'Duration', 'Total_Duration', 'Active'])
-        
-        activity_id = 1
-        for teacher, load in solution.items():
-            for course in load['課程']:
-                group_name = f"{course['年級']}年級{course['組別']}"
-                writer.writerow([
-                    activity_id,
-                    course['課程名稱'],
-                    teacher,
-                    group_name,
-                    course['節數'],
-                    course['節數'],
-                    'true'
-                ])
-                activity_id += 1
\ No newline at end of file
+        writer.writerow(['Year', 'Number_of_Students'])
+        groups = {name: size for year in data.years.values() for name, size in year.items()}
+        writer.writerows([name, groups[name]] for name in sorted(groups))
@@ -1,9 +1,14 @@
 from table import allocate_courses, courses, teachers
+from course_allocator import add_conflict_constraints, get_solver_backend, selected_courses
+from search import SearchBudget, evaluate_solution
+from search_checkpoint import SearchCheckpoint
+import config
+import random
 import copy
 from pulp import *
 from typing import List, Dict, Any, Tuple
 
-def allocate_main_subjects(initial_loads, courses):
+def allocate_main_subjects(initial_loads, courses, backend=None):
     """使用整數線性規劃分配國文和數學課"""
     # 複製初始負載
     result = copy.deepcopy(initial_loads)
@@ -38,62 +43,101 @@ def allocate_main_subjects(initial_loads, courses):
                      for i in range(len(main_courses))) == remaining_lessons[t]
     
     # 約束3：同年級同組別的國文和數學不能由同一位老師教授
-    for i in range(len(main_courses)):
-        for j in range(i + 1, len(main_courses)):
-            if (main_courses[i]["年級"] == main_courses[j]["年級"] and 
-                main_courses[i]["組別"] == main_courses[j]["組別"] and
-                main_courses[i]["課程名稱"] != main_courses[j]["課程名稱"]):
-                for t in teachers:
-                    prob += teacher_course[t, i] + teacher_course[t, j] <= 1
+    add_conflict_constraints(prob, teacher_course, main_courses, teachers)
     
     # 求解
-    status = prob.solve(PULP_CBC_CMD(msg=False))
+    status = get_solver_backend(backend).solve(prob)
     
     if status != 1:  # 如果沒有找到解
         return None
         
     # 根據求解結果分配課程
-    for t in teachers:
-        for i in range(len(main_courses)):
-            if value(teacher_course[t, i]) == 1:
-                result[t]["課程"].append(main_courses[i])
-                result[t]["節數"] += main_courses[i]["節數"]
-                result[t]["人次"] += main_courses[i]["人次"]
+    for t, assigned in selected_courses(teacher_course, teachers, range(len(main_courses))).items():
+        for i in assigned:
+            result[t].add(main_courses[i])
     
     return result
 
-def main():
-    while True:
+def print_solution(final_loads):
+    """輸出最終分配結果與人次、備課組別差異"""
+    print("\n最終分配結果:")
+    for teacher, load in final_loads.items():
+        print(f"\n{teacher}:")
+        for course in sorted(load["課程"], 
+                          key=lambda x: (x["課程名稱"], x["年級"], x["組別"])):
+            print(f"  - {course['課程名稱']} {course['組別']} "
+                  f"節數: {course['節數']}, 人次: {course['人次']}")
+        print(f"  總節數: {load['節數']}, 總人次: {load['人次']}")
+    hours_diff, groups_diff = evaluate_solution(final_loads)
+    print(f"\n人次差異 {hours_diff}、備課組別差異 {groups_diff}")
+
+def main(budget=None, checkpoint=None, resume=False):
+    """重複分配直到找到可行解，或嘗試次數、時間用完為止
+
+    傳入 checkpoint（SearchCheckpoint）時，每 checkpoint.interval 次嘗試記錄已嘗試次數與
+    亂數狀態，找到解時連同分配結果一起記錄；resume 為 True 時從檢查點接續
+    （先前已找到解時直接回傳該解），嘗試次數上限含先前的進度。
+    """
+    if budget is None:
+        budget = SearchBudget(config.MAX_ATTEMPTS, config.SEARCH_TIME_LIMIT)
+    budget.start()
+    attempts = 0
+    max_attempts = budget.max_attempts or config.MAX_ATTEMPTS
+    rng = random.Random(config.SEARCH_SEED)
+
+    if checkpoint is not None and resume:
+        state = checkpoint.load("grab", courses, teachers)
+        if state is not None:
+            attempts = state["attempts"]
+            rng.setstate(state["random_state"])
+            if state.get("final_loads") is not None:
+                print(f"檢查點中已有第 {attempts} 次嘗試找到的分配方案")
+                print_solution(state["final_loads"])
+                return state["final_loads"]
+            print(f"從檢查點接續：已完成 {attempts} 次嘗試")
+
+    def save_checkpoint(final_loads=None):
+        if checkpoint is not None:
+            checkpoint.save("grab", courses, teachers, attempts=attempts,
+                            random_state=rng.getstate(), final_loads=final_loads)
+
+    while attempts < max_attempts and not budget.expired():
+        if checkpoint is not None and attempts % checkpoint.interval == 0:
+            save_checkpoint()
+        attempts += 1
         try:
             # 1. 先分配社會、動作和學習課
-            initial_loads = allocate_courses(courses, teachers)
+            initial_loads = allocate_courses(courses, teachers, rng)
             
             # 2. 再分配國文和數學課
-            final_loads = allocate_main_subjects(initial_loads, courses)
+            final_loads = allocate_main_subjects(initial_loads, courses, budget.solver_backend())
             
             if final_loads is None:
                 print("無法找到可行的主科分配方案，重試中...")
                 continue
                 
-            # 輸出最終分配結果
-            print("\n最終分配結果:")
-            for teacher, load in final_loads.items():
-                print(f"\n{teacher}:")
-                for course in sorted(load["課程"], 
-                                  key=lambda x: (x["課程名稱"], x["年級"], x["組別"])):
-                    print(f"  - {course['課程名稱']} {course['組別']} "
-                          f"節數: {course['節數']}, 人次: {course['人次']}")
-                print(f"  總節數: {load['節數']}, 總人次: {load['人次']}")
-            
             # 驗證結果
             for teacher, load in final_loads.items():
                 assert load["節數"] == 16, f"{teacher} 總節數不是16"
-            
-            break
+
+            # 輸出最終分配結果
+            print_solution(final_loads)
+            print(f"\n共 {attempts} 次嘗試，耗時 {budget.elapsed():.1f} 秒")
+            save_checkpoint(final_loads)
+            return final_loads
             
         except Exception as e:
             print(f"發生錯誤: {e}，重試中...")
             continue
 
+    save_checkpoint()
+    print(f"\n在 {attempts} 次嘗試、{budget.elapsed():.1f} 秒內找不到可行的分配方案")
+    return None
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description="以線性規劃分配主科")
+    parser.add_argument("--resume", action="store_true", help="從檢查點（config.CHECKPOINT_PATH）接續")
+    args = parser.parse_args()
+    main(checkpoint=SearchCheckpoint() if config.CHECKPOINT_PATH else None,
+         resume=args.resume or config.RESUME_SEARCH)
\ No newline at end of file
@@ -1,4 +1,5 @@
 from table import allocate_courses, courses, teachers
+from course_allocator import add_conflict_constraints, get_solver_backend, selected_courses
 import copy
 from pulp import *
 from typing import List, Dict, Any, Tuple
@@ -86,13 +87,7 @@ def allocate_chinese_math(initial_loads, courses):
                      for i in range(len(chinese_math_courses))) == remaining_lessons[t]
     
     # 約束3：同年級同組別的國文和數學不能由同一位老師教授
-    for i in range(len(chinese_math_courses)):
-        for j in range(i + 1, len(chinese_math_courses)):
-            if (chinese_math_courses[i]["年級"] == chinese_math_courses[j]["年級"] and 
-                chinese_math_courses[i]["組別"] == chinese_math_courses[j]["組別"] and
-                chinese_math_courses[i]["課程名稱"] != chinese_math_courses[j]["課程名稱"]):
-                for t in teachers:
-                    prob += teacher_course[t, i] + teacher_course[t, j] <= 1
+    add_conflict_constraints(prob, teacher_course, chinese_math_courses, teachers)
     
     # 計算每位老師的總人次和備課組別數
     current_student_hours = {t: result[t]["人次"] for t in teachers}
@@ -116,18 +111,15 @@ def allocate_chinese_math(initial_loads, courses):
     prob += max_prep_groups - min_prep_groups <= 1
     
     # 求解
-    status = prob.solve(PULP_CBC_CMD(msg=False))
+    status = get_solver_backend().solve(prob)
     
     if status != 1:
         return None
         
     # 根據求解結果分配課程
-    for t in teachers:
-        for i in range(len(chinese_math_courses)):
-            if value(teacher_course[t, i]) == 1:
-                result[t]["課程"].append(chinese_math_courses[i])
-                result[t]["節數"] += chinese_math_courses[i]["節數"]
-                result[t]["人次"] += chinese_math_courses[i]["人次"]
+    for t, assigned in selected_courses(teacher_course, teachers, range(len(chinese_math_courses))).items():
+        for i in assigned:
+            result[t].add(chinese_math_courses[i])
     
     return result
 
@@ -0,0 +1,188 @@
+# local_search.py
+import random
+from collections import Counter
+from itertools import combinations
+
+import config
+from config import BASIC_SUBJECTS, MAIN_SUBJECTS
+from table import courses as table_courses, find_special_courses
+from teacher_load import as_teacher_load
+
+
+class LocalSearch:
+    """以交換課程改善已可行的分配（爬山法）
+
+    每一步在兩位老師之間交換節數總和相同的課程（一換一或一換二），因此每位老師
+    的總節數不變；交換前以各老師即時維護的科目數、國數備課組別與 (年級, 組別)
+    佔用表檢查特需課程規則、特定 5 堂課、國數都要有與同組衝堂，並只重新計算
+    兩位受影響老師的人次與備課組數。國數模型對固定的特需分配已是最佳解，
+    改善主要來自連同特需課程一起交換。
+    """
+
+    def __init__(self, loads, courses=None, seed=None):
+        courses = courses if courses is not None else table_courses
+        self.teachers = list(loads)
+        self.loads = {t: as_teacher_load(load).copy() for t, load in loads.items()}
+        self.special_ids = {id(c) for c in find_special_courses(courses)}
+        self.rng = random.Random(seed)
+
+        # 每位老師的國數 (年級, 組別) → 科目課程數，用來檢查同組衝堂
+        self.cells = {t: Counter() for t in self.teachers}
+        for t, load in self.loads.items():
+            for course in load["課程"]:
+                self._occupy(t, course, 1)
+
+        self.hours = {t: load["人次"] for t, load in self.loads.items()}
+        self.groups = {t: self._prep_groups(load) for t, load in self.loads.items()}
+        # 每位老師拿到的特定課程數，交換時與人次、備課組數一起更新
+        self.specials = {t: sum(1 for c in load["課程"] if id(c) in self.special_ids)
+                         for t, load in self.loads.items()}
+        self.moves = 0
+        self.evaluations = 0
+
+    @staticmethod
+    def _prep_groups(load):
+        return load.basic_prep_groups + load.chinese_math_prep_groups
+
+    def _occupy(self, t, course, n):
+        if course["課程名稱"] in MAIN_SUBJECTS:
+            self.cells[t][(course["年級"], course["組別"], course["課程名稱"])] += n
+
+    def score(self, hours=None, groups=None):
+        """(超出的備課組別差異, 人次差異, 備課組別差異, 人次平方和)，越小越好"""
+        hours = hours or self.hours
+        groups = groups or self.groups
+        hours_diff = max(hours.values()) - min(hours.values())
+        groups_diff = max(groups.values()) - min(groups.values())
+        return (max(0, groups_diff - config.MAX_GROUPS_SPREAD), hours_diff, groups_diff, sum(h * h for h in hours.values()))
+
+    def _after(self, t, removed, added):
+        """老師 t 移除 removed、加入 added 後的 (人次, 備課組數)；違反規則時回傳 None"""
+        load = self.loads[t]
+        counts = {s: load.subject_counts[s] for s in BASIC_SUBJECTS + MAIN_SUBJECTS}
+        prep_delta = Counter()
+        cell_delta = Counter()
+        specials_before = specials = self.specials[t]
+        hours = load["人次"]
+        for course, sign in [(c, -1) for c in removed] + [(c, 1) for c in added]:
+            subject = course["課程名稱"]
+            counts[subject] += sign
+            hours += sign * course["人次"]
+            if id(course) in self.special_ids:
+                specials += sign
+            if subject in MAIN_SUBJECTS:
+                prep_delta[(subject, course["年級"])] += sign
+                cell_delta[(course["年級"], course["組別"], subject)] += sign
+
+        # 特需課程規則（同 verify_allocation）與特定 5 堂課：
+        # 第一階段的結果不一定符合，因此只要求有變動特需課程的老師交換後符合
+        if specials != specials_before or any(counts[s] != load.subject_counts[s] for s in BASIC_SUBJECTS):
+            if counts["社會"] == 1:
+                if not (counts["動作"] == 1 and counts["學習"] == 1):
+                    return None
+            elif counts["社會"] != 2:
+                return None
+            if counts["學習"] > 1 or specials > 1:
+                return None
+
+        # 每位老師至少一堂國語和一堂數學
+        if counts["國語"] == 0 or counts["數學"] == 0:
+            return None
+
+        # 同年級同組別不同科目不能由同一人授課
+        cells = self.cells[t]
+        for grade, group, subject in cell_delta:
+            if cells[(grade, group, subject)] + cell_delta[(grade, group, subject)] <= 0:
+                continue
+            for other in MAIN_SUBJECTS:
+                if other != subject and cells[(grade, group, other)] + cell_delta[(grade, group, other)] > 0:
+                    return None
+
+        chinese_math_groups = len(load.prep_groups)
+        for key, delta in prep_delta.items():
+            before = load.prep_groups.get(key, 0)
+            chinese_math_groups += (before + delta > 0) - (before > 0)
+        basic_groups = sum(counts[s] for s in BASIC_SUBJECTS)
+        return hours, basic_groups + chinese_math_groups
+
+    def evaluate(self, t1, out1, t2, out2):
+        """評估交換的結果分數，不可行時回傳 None"""
+        self.evaluations += 1
+        first = self._after(t1, out1, out2)
+        if first is None:
+            return None
+        second = self._after(t2, out2, out1)
+        if second is None:
+            return None
+        hours = dict(self.hours)
+        groups = dict(self.groups)
+        hours[t1], groups[t1] = first
+        hours[t2], groups[t2] = second
+        return self.score(hours, groups)
+
+    def apply(self, t1, out1, t2, out2):
+        """執行交換並更新人次、備課組數、特定課程數與佔用表"""
+        for source, target, moved in ((t1, t2, out1), (t2, t1, out2)):
+            for course in moved:
+                self.loads[source].remove(course)
+                self._occupy(source, course, -1)
+                self.loads[target].add(course)
+                self._occupy(target, course, 1)
+                if id(course) in self.special_ids:
+                    self.specials[source] -= 1
+                    self.specials[target] += 1
+        for t in (t1, t2):
+            self.hours[t] = self.loads[t]["人次"]
+            self.groups[t] = self._prep_groups(self.loads[t])
+        self.moves += 1
+
+    def neighbours(self):
+        """以隨機順序列出所有節數相同的交換 (t1, 移出的課, t2, 移入的課)"""
+        moves = []
+        for t1, t2 in combinations(self.teachers, 2):
+            for a, b in ((t1, t2), (t2, t1)):
+                mine = self.loads[a]["課程"]
+                theirs = self.loads[b]["課程"]
+                pairs = list(combinations(theirs, 2))
+                for course in mine:
+                    for other in theirs:
+                        if a == t1 and other["節數"] == course["節數"]:
+                            moves.append((a, (course,), b, (other,)))
+                    for pair in pairs:
+                        if pair[0]["節數"] + pair[1]["節數"] == course["節數"]:
+                            moves.append((a, (course,), b, pair))
+        self.rng.shuffle(moves)
+        return moves
+
+    def run(self, target=None, max_iterations=1000):
+        """首次改善爬山法：接受第一個讓分數變小的交換，直到達到目標或沒有改善為止
+
+        target 為可接受的人次差異（備課組別差異也需不超過 config.MAX_GROUPS_SPREAD）。
+        """
+        current = self.score()
+        for _ in range(max_iterations):
+            if target is not None and current[0] == 0 and current[1] <= target:
+                break
+            for move in self.neighbours():
+                candidate = self.evaluate(*move)
+                if candidate is not None and candidate < current:
+                    self.apply(*move)
+                    current = candidate
+                    break
+            else:
+                # 局部最佳解
+                break
+        return self.loads
+
+
+def refine_allocation(loads, courses=None, target=None, max_iterations=1000, seed=None, stats=None):
+    """以區域搜尋改善可行的分配，回傳新的老師負載（不修改傳入的負載）
+
+    若傳入 stats（Counter），會累加交換次數（refine_moves）與評估次數（refine_evaluations）。
+    """
+    search = LocalSearch(loads, courses, seed)
+    refined = search.run(target, max_iterations)
+    if stats is not None:
+        stats["refine_moves"] += search.moves
+        stats["refine_evaluations"] += search.evaluations
+    return refined
@@ -1,11 +1,13 @@
 # main.py
 import os
-from course_allocator import (allocate_courses, allocate_chinese_math,
-                            calculate_basic_prep_groups, calculate_chinese_math_prep_groups, 
-                            verify_chinese_math)
+import config
+from course_allocator import calculate_basic_prep_groups, calculate_chinese_math_prep_groups
+from search import search_with_budget, SearchBudget
+from search_trace import SearchTracer
+from candidate_store import CandidateStore
+from search_checkpoint import SearchCheckpoint
 from data_handler import save_to_csv, update_excel_with_solution
 from fet_converter import convert_to_fet_format
-from table import courses, teachers
 
 def get_user_choice():
     """獲取用戶選擇"""
@@ -22,51 +24,38 @@ def get_user_choice():
         else:
             print("無效的輸入，請重試。")
 
-def main():
-    max_attempts = 1000
-    best_solution = None
-    min_student_hours_diff = float('inf')
-    min_prep_groups_diff = float('inf')
-    
-    for attempt in range(max_attempts):
-        try:
-            # 1. 先分配社會、動作和學習課（特需課程）
-            initial_loads = allocate_courses(courses, teachers)
-            
-            # 2. 再分配國文和數學課（國數課程）
-            final_loads = allocate_chinese_math(initial_loads, courses)
-            
-            if final_loads is None:
-                continue
-            
-            # 檢查每位老師是否都至少有一堂國語和一堂數學
-            if not verify_chinese_math(final_loads):
-                continue
-            
-            # 計算人次差異和備課組別差異
-            student_hours = [load["人次"] for load in final_loads.values()]
-            hours_diff = max(student_hours) - min(student_hours)
-            
-            prep_groups = [calculate_basic_prep_groups(load) + calculate_chinese_math_prep_groups(load) 
-                         for load in final_loads.values()]
-            groups_diff = max(prep_groups) - min(prep_groups)
-            
-            # 如果是更好的解，就保存下來
-            if groups_diff <= 1 and hours_diff < min_student_hours_diff:
-                min_student_hours_diff = hours_diff
-                min_prep_groups_diff = groups_diff
-                best_solution = final_loads
-                
-                # 如果人次差異也在可接受範圍內，就可以結束了
-                if hours_diff <= 10:
-                    break
-            
-        except Exception as e:
-            continue
+def main(resume=None):
+    # 重複兩階段分配，保留人次差異最小的解（可設定平行行程數與時間上限）
+    tracer = SearchTracer(config.TRACE_PATH)
+    budget = SearchBudget(config.MAX_ATTEMPTS, config.SEARCH_TIME_LIMIT)
+    store = CandidateStore() if config.CANDIDATE_DB_PATH else None
+    # 設定檢查點時定期保存進度，resume 時從上次中斷處接續
+    checkpoint = SearchCheckpoint() if config.CHECKPOINT_PATH else None
+    if resume is None:
+        resume = config.RESUME_SEARCH
+    result = search_with_budget(budget, config.SEARCH_WORKERS, tracer=tracer, store=store,
+                                checkpoint=checkpoint, resume=resume)
+    tracer.close()
+    if store is not None:
+        store.close()
+        print(f"\n評估過的分配已保存至 {store.path}（第 {result['run_id']} 次搜尋）")
+    print("\n搜尋統計：")
+    print(tracer.format_summary())
+    best_solution = result["solution"]
     
     if best_solution is None:
         print("無法找到可行解")
         return
+
+    if "pareto_front" in result:
+        print("\n非支配解（人次差異 / 備課組別差異）：")
+        for k, point in enumerate(result["pareto_front"], 1):
+            print(f"  {k}. 人次差異 {point['hours_diff']}、備課組別差異 {point['groups_diff']}"
+                  f"（第 {point['attempt']} 次嘗試）")
+
+    stop_reason = "時間用完" if result["budget_exhausted"] else "搜尋結束"
+    print(f"\n{stop_reason}：共 {result['attempts']} 次嘗試，耗時 {result['elapsed']:.1f} 秒，"
+          f"最佳解人次差異 {result['hours_diff']}、備課組別差異 {result['groups_diff']}")
     
     while True:
         # 輸出最終分配結果
@@ -113,10 +102,14 @@ def main():
 
         elif choice == '2':
             print("\n重新產生分配方案...")
-            return main()
+            return main(resume=False)
         else:  # choice == '3'
             print("\n程式結束")
             break
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description="特殊教育班排課")
+    parser.add_argument("--resume", action="store_true", help="從檢查點（config.CHECKPOINT_PATH）接續上次的搜尋")
+    args = parser.parse_args()
+    main(resume=args.resume or None)
\ No newline at end of file
@@ -0,0 +1,616 @@
+# search.py
+import random
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from multiprocessing import Manager
+
+import config
+from course_allocator import (allocate_courses, TeacherLoad, allocate_chinese_math, allocate_all_courses,
+                            calculate_basic_prep_groups, calculate_chinese_math_prep_groups,
+                            verify_chinese_math, get_solver_backend, chinese_math_pareto_front,
+                            export_solve_cache, restore_solve_cache, phase2_key)
+from table import courses as table_courses, teachers as table_teachers
+from table import verify_allocation, enumerate_allocations, count_allocations
+from search_trace import SearchTracer, NULL_TRACER
+from local_search import refine_allocation
+from excel_loader import load_courses
+from candidate_store import record_candidate
+
+
+def evaluate_solution(final_loads):
+    """計算人次差異和備課組別差異"""
+    student_hours = [load["人次"] for load in final_loads.values()]
+    hours_diff = max(student_hours) - min(student_hours)
+
+    prep_groups = [calculate_basic_prep_groups(load) + calculate_chinese_math_prep_groups(load)
+                   for load in final_loads.values()]
+    groups_diff = max(prep_groups) - min(prep_groups)
+    return hours_diff, groups_diff
+
+
+def is_better(candidate, best):
+    """判斷候選解是否優於目前最佳解（備課組別差異不超過上限且人次差異更小）"""
+    hours_diff, groups_diff = candidate[0], candidate[1]
+    if groups_diff > config.MAX_GROUPS_SPREAD:
+        return False
+    return best is None or hours_diff < best[0]
+
+
+def is_good_enough(candidate):
+    """人次差異在可接受範圍內就可以結束搜尋"""
+    return candidate is not None and candidate[0] <= 10
+
+
+class SearchBudget:
+    """整次搜尋的預算：最多嘗試次數與／或牆鐘時間上限（秒）
+
+    截止時間以 time.time() 記錄，可直接傳給平行工作行程；
+    每次求解的時間上限取 config.SOLVE_TIME_LIMIT 與剩餘時間的較小者。
+    """
+
+    def __init__(self, max_attempts=None, time_limit=None):
+        self.max_attempts = max_attempts
+        self.time_limit = time_limit
+        self.started_at = None
+        self.deadline = None
+
+    def start(self):
+        """開始計時"""
+        self.started_at = time.time()
+        if self.time_limit is not None:
+            self.deadline = self.started_at + self.time_limit
+        return self
+
+    def elapsed(self):
+        return time.time() - self.started_at if self.started_at is not None else 0.0
+
+    def remaining(self):
+        """剩餘秒數，沒有時間上限時回傳 None"""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.time())
+
+    def expired(self):
+        return self.deadline is not None and time.time() >= self.deadline
+
+    def solve_time_limit(self):
+        """本次求解可用的時間上限（秒），None 表示不限制"""
+        limit = config.SOLVE_TIME_LIMIT
+        remaining = self.remaining()
+        if remaining is None:
+            return limit
+        return remaining if limit is None else min(limit, remaining)
+
+    def solver_backend(self, name=None):
+        """依剩餘時間建立本次求解使用的求解器後端（name 未指定時依 config.SOLVER_BACKEND）"""
+        return get_solver_backend(name, time_limit=self.solve_time_limit())
+
+
+def resolve_table(courses=None, teachers=None):
+    """未指定課表或老師名單時使用預設資料（課程依 config.COURSE_SOURCE，老師為 table.py 中的名單）"""
+    if courses is None:
+        courses = load_courses() if config.COURSE_SOURCE == "excel" else table_courses
+    return courses, teachers if teachers is not None else table_teachers
+
+
+def solve_phase2(initial_loads, stats, courses=None, tracer=NULL_TRACER, attempt=None, backend=None,
+                 require_chinese_math=None):
+    """分配國數課並檢查國數規則，失敗時回傳 None 並記錄原因"""
+    courses, _ = resolve_table(courses)
+    final_loads = allocate_chinese_math(initial_loads, courses, require_chinese_math, tracer=tracer,
+                                        backend=backend)
+    if final_loads is None:
+        stats["infeasible"] += 1
+        tracer.record(attempt, "infeasible")
+        return None
+
+    # 檢查每位老師是否都至少有一堂國語和一堂數學
+    # （模型已要求時不應再被篩掉；未要求時即為舊流程浪費的嘗試次數）
+    with tracer.phase("verify"):
+        is_valid = verify_chinese_math(final_loads)
+    if not is_valid:
+        stats["chinese_math_rejected"] += 1
+        tracer.record(attempt, "chinese_math_rejected")
+        return None
+
+    return final_loads
+
+
+def run_attempt(seed, stats=None, courses=None, teachers=None, tracer=NULL_TRACER, attempt=None,
+                backend=None, loads=None):
+    """以指定種子執行一次完整的兩階段分配，失敗時回傳 None
+
+    第一階段使用以 seed 建立的 random.Random，不依賴全域亂數狀態；
+    loads 為可重複使用的第一階段負載（第二階段會另外複製，不影響回傳結果）。
+    """
+    courses, teachers = resolve_table(courses, teachers)
+    if stats is None:
+        stats = Counter()
+    stats["attempts"] += 1
+
+    # 1. 先分配社會、動作和學習課（特需課程）
+    with tracer.phase("phase1"):
+        initial_loads = allocate_courses(courses, teachers, random.Random(seed), loads)
+
+    # 2. 再分配國文和數學課（國數課程）
+    return solve_phase2(initial_loads, stats, courses, tracer, attempt, backend)
+
+
+def score_attempt(final_loads, stats, tracer=NULL_TRACER, attempt=None):
+    """計算一次成功嘗試的人次與備課組別差異，並記錄結果"""
+    with tracer.phase("score"):
+        hours_diff, groups_diff = evaluate_solution(final_loads)
+    if groups_diff > config.MAX_GROUPS_SPREAD:
+        stats["groups_rejected"] += 1
+        tracer.record(attempt, "groups_rejected", hours_diff=hours_diff, groups_diff=groups_diff)
+    else:
+        tracer.record(attempt, "accepted", hours_diff=hours_diff, groups_diff=groups_diff)
+    return hours_diff, groups_diff
+
+
+def search_chunk(base_seed, start, count, stop_event=None, courses=None, teachers=None, tracer=None,
+                 budget=None, store=None):
+    """執行一段連續的嘗試
+
+    回傳 (此段的最佳解, 統計, tracer)，最佳解為 (人次差異, 備課組別差異, 分配結果, 嘗試編號)。
+    budget 的時間用完時停止，並在統計中記錄 budget_exhausted。
+    傳入 store（CandidateStore）時，每個評估過的分配都會連同種子寫入資料庫。
+    """
+    best = None
+    stats = Counter()
+    if tracer is None:
+        tracer = SearchTracer()
+    # 同一批次的第一階段重複使用同一組負載
+    loads = {t: TeacherLoad() for t in resolve_table(courses, teachers)[1]}
+    for attempt in range(start, start + count):
+        # 其他工作已找到可接受的解
+        if stop_event is not None and stop_event.is_set():
+            break
+        if budget is not None and budget.expired():
+            stats["budget_exhausted"] += 1
+            break
+        try:
+            backend = budget.solver_backend() if budget is not None else None
+            final_loads = run_attempt(base_seed + attempt, stats, courses, teachers, tracer, attempt,
+                                      backend, loads)
+            if final_loads is None:
+                continue
+
+            # 以交換課程的區域搜尋改善 ILP 的解
+            if config.LOCAL_SEARCH:
+                with tracer.phase("refine"):
+                    final_loads = refine_allocation(final_loads, resolve_table(courses)[0],
+                                                    max_iterations=config.LOCAL_SEARCH_ITERATIONS,
+                                                    seed=base_seed + attempt, stats=stats)
+
+            hours_diff, groups_diff = score_attempt(final_loads, stats, tracer, attempt)
+            record_candidate(store, final_loads, hours_diff, groups_diff, attempt, base_seed + attempt)
+            candidate = (hours_diff, groups_diff, dict(final_loads), attempt)
+            if is_better(candidate, best):
+                best = candidate
+                if is_good_enough(best):
+                    if stop_event is not None:
+                        stop_event.set()
+                    break
+        except Exception as e:
+            stats["errors"] += 1
+            tracer.record_exception(attempt, e)
+            continue
+    if store is not None:
+        store.flush()
+    return best, stats, tracer
+
+
+def merge_best(best, candidate):
+    """合併兩個批次的最佳解，人次差異相同時取嘗試編號較小者"""
+    if candidate is None:
+        return best
+    if best is None:
+        return candidate
+    if is_better(candidate, best) or (candidate[0] == best[0] and candidate[3] < best[3]):
+        return candidate
+    return best
+
+
+class SearchProgress:
+    """restart 模式的搜尋進度：已完成的批次、最佳解與統計
+
+    嘗試 k 的種子固定為 base_seed + k，因此記下哪些批次已全部跑完就能從中斷處接續。
+    只有跑完的批次才算進檢查點；因時間用完或其他批次已找到解而中途停止的批次，
+    其統計只計入本次執行（partial），接續時會整批重跑。
+    傳入 checkpoint（SearchCheckpoint）時，每完成一個批次就寫入檢查點。
+    """
+
+    def __init__(self, base_seed, chunk_size, courses, teachers, checkpoint=None, state=None):
+        self.base_seed = base_seed
+        self.chunk_size = chunk_size
+        self.courses = courses
+        self.teachers = teachers
+        self.checkpoint = checkpoint
+        self.completed = set()
+        self.best = None
+        self.stats = Counter()
+        self.partial = Counter()
+        self.run_id = None
+        if state is not None:
+            self.base_seed = state["base_seed"]
+            self.chunk_size = state["chunk_size"]
+            self.completed = set(state["completed"])
+            self.best = state["best"]
+            self.stats = Counter(state["stats"])
+            self.run_id = state.get("run_id")
+
+    @classmethod
+    def resume(cls, checkpoint, base_seed, chunk_size, courses, teachers):
+        """從檢查點還原進度（連同國數求解快取），沒有可用的檢查點時從頭開始"""
+        state = checkpoint.load("search", courses, teachers)
+        if state is not None:
+            restore_solve_cache(courses, teachers, state["solve_cache"])
+        return cls(base_seed, chunk_size, courses, teachers, checkpoint, state)
+
+    def pending_chunks(self, max_attempts):
+        """尚未完成的批次 (起始嘗試編號, 嘗試次數)"""
+        return [(start, min(self.chunk_size, max_attempts - start))
+                for start in range(0, max_attempts, self.chunk_size) if start not in self.completed]
+
+    def finish_chunk(self, start, count, chunk_best, chunk_stats):
+        """合併一個批次的結果，整批跑完時記為完成並寫入檢查點"""
+        self.best = merge_best(self.best, chunk_best)
+        if chunk_stats["attempts"] < count:
+            self.partial.update(chunk_stats)
+            return
+        self.completed.add(start)
+        self.stats.update(chunk_stats)
+        self.save()
+
+    def total_stats(self):
+        return self.stats + self.partial
+
+    def save(self):
+        if self.checkpoint is None:
+            return
+        # 平行搜尋時求解快取在各工作行程中，這裡只保存主行程的快取
+        self.checkpoint.save("search", self.courses, self.teachers,
+                             mode="restart", base_seed=self.base_seed, chunk_size=self.chunk_size,
+                             completed=sorted(self.completed), best=self.best, stats=dict(self.stats),
+                             run_id=self.run_id,
+                             solve_cache=export_solve_cache(self.courses, self.teachers))
+
+
+def sequential_search(max_attempts, progress, stop_event=None, tracer=NULL_TRACER, budget=None, store=None):
+    """在單一行程中依序執行尚未完成的批次，每批結束後更新進度"""
+    for start, count in progress.pending_chunks(max_attempts):
+        if is_good_enough(progress.best):
+            break
+        if budget is not None and budget.expired():
+            progress.partial["budget_exhausted"] += 1
+            break
+        chunk_best, chunk_stats, _ = search_chunk(progress.base_seed, start, count, stop_event,
+                                                  progress.courses, progress.teachers, tracer, budget, store)
+        progress.finish_chunk(start, count, chunk_best, chunk_stats)
+    return progress.best, progress.total_stats()
+
+
+def parallel_search(base_seed, max_attempts, workers, chunk_size, courses=None, teachers=None,
+                    tracer=None, budget=None, store=None, progress=None):
+    """將嘗試分批交給多個行程，任一行程達到停止條件或時間用完就取消其餘工作
+
+    store 會序列化給各工作行程，由各行程自行連線並在批次結束時寫入。
+    傳入 progress（SearchProgress）時只執行尚未完成的批次，並在每批完成時更新進度。
+    """
+    if progress is None:
+        progress = SearchProgress(base_seed, chunk_size, courses, teachers)
+    # 工作行程不直接寫追蹤檔，只緩衝紀錄，由主行程合併後寫出
+    keep_records = tracer is not None and tracer.trace_path is not None
+    with Manager() as manager:
+        stop_event = manager.Event()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunks = {
+                executor.submit(search_chunk, progress.base_seed, start, count, stop_event,
+                                courses, teachers, SearchTracer(keep_records=keep_records), budget,
+                                store): (start, count)
+                for start, count in progress.pending_chunks(max_attempts)
+            }
+            pending = set(chunks)
+            while pending:
+                timeout = budget.remaining() if budget is not None else None
+                done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.cancelled():
+                        continue
+                    chunk_best, chunk_stats, chunk_tracer = future.result()
+                    progress.finish_chunk(*chunks[future], chunk_best, chunk_stats)
+                    if tracer is not None:
+                        tracer.merge(chunk_tracer)
+                if budget is not None and budget.expired() and pending:
+                    progress.partial["budget_exhausted"] += 1
+                if is_good_enough(progress.best) or (budget is not None and budget.expired()):
+                    stop_event.set()
+                    for future in pending:
+                        future.cancel()
+    return progress.best, progress.total_stats()
+
+
+def global_search(courses=None, teachers=None, tracer=NULL_TRACER, budget=None, store=None):
+    """以單一 ILP 一次分配所有課程，不符合規則時回傳 None"""
+    courses, teachers = resolve_table(courses, teachers)
+    stats = Counter(attempts=1)
+    backend = budget.solver_backend() if budget is not None else None
+    with tracer.phase("solve"):
+        final_loads = allocate_all_courses(courses, list(teachers), backend)
+    if final_loads is None:
+        stats["infeasible"] += 1
+        tracer.record(0, "infeasible")
+        return None, stats
+
+    with tracer.phase("verify"):
+        is_valid, message = verify_allocation(final_loads)
+        is_valid = is_valid and verify_chinese_math(final_loads)
+    if not is_valid:
+        stats["rejected"] += 1
+        tracer.record(0, "rejected")
+        return None, stats
+
+    hours_diff, groups_diff = score_attempt(final_loads, stats, tracer, 0)
+    record_candidate(store, final_loads, hours_diff, groups_diff, 0)
+    return (hours_diff, groups_diff, dict(final_loads), 0), stats
+
+
+def exhaustive_search(courses=None, teachers=None, tracer=NULL_TRACER, budget=None, store=None,
+                      checkpoint=None, state=None):
+    """逐一嘗試所有合法的特需課程分配（見 table.enumerate_allocations），回傳備課組別差異上限內人次差異最小的解
+
+    國數求解結果只取決於第一階段的簽章（course_allocator.phase2_key），簽章相同的分配只求解一次；
+    國數模型一律要求每位老師都有國語和數學，不會因事後檢查而漏掉合法的解。
+    每次求解都求到最佳（沒有 SOLVE_TIME_LIMIT、SOLVE_MIP_GAP）且未用完時間時，結果即為所有合法分配中的最佳解；
+    時間用完時回傳目前最佳解。
+    國數求解使用 config.EXHAUSTIVE_BACKEND（None 時依 config.SOLVER_BACKEND）；預設課表有
+    737,280 種分配、9,255 個不同簽章，開始前會印出分配數與使用的後端。
+    列舉順序固定，傳入 checkpoint（SearchCheckpoint）時每求解 checkpoint.interval 個簽章與結束時
+    記錄下一個要處理的分配位置、已求解的簽章、最佳解與統計；state 為 checkpoint.load("exhaustive", ...)
+    的結果時從該位置接續（已跑完時直接回傳先前的最佳解）。
+    """
+    courses, teachers = resolve_table(courses, teachers)
+    best = None
+    stats = Counter()
+    seen = set()
+    position = 0
+    if state is not None:
+        position = state["position"]
+        best = state["best"]
+        stats = Counter(state["stats"])
+        seen = set(state["seen"])
+
+    def save(next_position, finished=False):
+        if checkpoint is not None:
+            checkpoint.save("exhaustive", courses, teachers, position=next_position, finished=finished,
+                            best=best, stats=dict(stats), seen=seen,
+                            run_id=store.run_id if store is not None else None)
+
+    if state is not None and state["finished"]:
+        return best, stats
+
+    backend_name = config.EXHAUSTIVE_BACKEND or config.SOLVER_BACKEND
+    print(f"exhaustive 模式：共 {count_allocations(courses, list(teachers))} 種特需分配"
+          f"（國數簽章相同的只求解一次），以 {backend_name} 後端求解")
+
+    attempt = position - 1
+    saved_attempts = stats["attempts"]
+    for attempt, initial_loads in enumerate(enumerate_allocations(courses, list(teachers))):
+        if attempt < position:
+            continue
+        if budget is not None and budget.expired():
+            save(attempt)
+            stats["budget_exhausted"] += 1
+            return best, stats
+        if checkpoint is not None and stats["attempts"] - saved_attempts >= checkpoint.interval:
+            save(attempt)
+            saved_attempts = stats["attempts"]
+        # 簽章相同的分配在國數求解後的人次與備課組別差異也相同
+        with tracer.phase("phase1"):
+            key = phase2_key(initial_loads, courses, require_chinese_math=True)
+        if key in seen:
+            stats["duplicate_signature"] += 1
+            continue
+        seen.add(key)
+        stats["attempts"] += 1
+        try:
+            backend = budget.solver_backend(backend_name) if budget is not None else backend_name
+            final_loads = solve_phase2(initial_loads, stats, courses, tracer, attempt, backend,
+                                       require_chinese_math=True)
+            if final_loads is None:
+                continue
+
+            hours_diff, groups_diff = score_attempt(final_loads, stats, tracer, attempt)
+            record_candidate(store, final_loads, hours_diff, groups_diff, attempt)
+            candidate = (hours_diff, groups_diff, dict(final_loads), attempt)
+            if is_better(candidate, best):
+                best = candidate
+        except Exception as e:
+            stats["errors"] += 1
+            tracer.record_exception(attempt, e)
+            continue
+    save(max(position, attempt + 1), finished=True)
+    return best, stats
+
+
+def add_to_front(front, candidate):
+    """將候選解加入非支配解集合，並移除被它支配的解
+
+    候選解被支配或與既有解的 (人次差異, 備課組別差異) 相同時不加入，回傳是否加入。
+    """
+    hours_diff, groups_diff = candidate[0], candidate[1]
+    if any(other[0] <= hours_diff and other[1] <= groups_diff for other in front):
+        return False
+    front[:] = [other for other in front if not (hours_diff <= other[0] and groups_diff <= other[1])]
+    front.append(candidate)
+    front.sort(key=lambda c: (c[1], c[0]))
+    return True
+
+
+def pareto_search(base_seed, max_attempts, courses=None, teachers=None, tracer=NULL_TRACER, budget=None,
+                  store=None):
+    """重複隨機特需分配，對每次的國數分配求非支配解，合併成整次搜尋的非支配解集合
+
+    回傳 (非支配解列表, 統計)，每個解為 (人次差異, 備課組別差異, 分配結果, 嘗試編號)，
+    依備課組別差異遞增排列。
+    """
+    courses, teachers = resolve_table(courses, teachers)
+    front = []
+    stats = Counter()
+    for attempt in range(max_attempts):
+        if budget is not None and budget.expired():
+            stats["budget_exhausted"] += 1
+            break
+        stats["attempts"] += 1
+        try:
+            with tracer.phase("phase1"):
+                initial_loads = allocate_courses(courses, teachers, random.Random(base_seed + attempt))
+
+            backend = budget.solver_backend() if budget is not None else None
+            points = chinese_math_pareto_front(initial_loads, courses, require_chinese_math=True,
+                                              tracer=tracer, backend=backend)
+            if not points:
+                stats["infeasible"] += 1
+                tracer.record(attempt, "infeasible")
+                continue
+
+            added = 0
+            for final_loads in points:
+                with tracer.phase("verify"):
+                    is_valid = verify_chinese_math(final_loads)
+                if not is_valid:
+                    stats["chinese_math_rejected"] += 1
+                    continue
+                with tracer.phase("score"):
+                    hours_diff, groups_diff = evaluate_solution(final_loads)
+                record_candidate(store, final_loads, hours_diff, groups_diff, attempt, base_seed + attempt)
+                added += add_to_front(front, (hours_diff, groups_diff, dict(final_loads), attempt))
+            stats["pareto_points"] += len(points)
+            tracer.record(attempt, "pareto", points=len(points), added=added)
+        except Exception as e:
+            stats["errors"] += 1
+            tracer.record_exception(attempt, e)
+            continue
+    return front, stats
+
+
+def search_with_budget(budget=None, workers=None, seed=None, chunk_size=None, mode=None,
+                       courses=None, teachers=None, tracer=None, store=None, checkpoint=None, resume=False):
+    """在預算內搜尋，回傳最佳解與其品質指標
+
+    回傳 dict：solution（找不到時為 None）、hours_diff、groups_diff、attempt（最佳解的嘗試編號）、
+    attempts、elapsed（秒）、budget_exhausted（是否因時間用完而停止）與 stats。
+    pareto 模式另有 pareto_front：各非支配解的 {hours_diff, groups_diff, attempt, solution}，
+    solution 則為其中備課組別差異不超過上限且人次差異最小者。
+    budget 未指定時依 config.MAX_ATTEMPTS 與 config.SEARCH_TIME_LIMIT。
+    傳入 store（CandidateStore）時，每個評估過的分配都會寫入資料庫，result 另有 run_id。
+    傳入 checkpoint（SearchCheckpoint，支援 restart 與 exhaustive 模式，其他模式會提示後不寫檢查點）時
+    定期寫入檢查點；resume 為 True 時從檢查點接續（restart：種子、已完成的批次、最佳解、統計與求解快取，
+    budget 的嘗試次數為含先前進度的總數；exhaustive：列舉位置、已求解的簽章、最佳解與統計）。
+    """
+    if budget is None:
+        budget = SearchBudget(config.MAX_ATTEMPTS, config.SEARCH_TIME_LIMIT)
+    budget.start()
+
+    mode = mode or config.SOLVER_MODE
+    front = None
+    if seed is None:
+        seed = config.SEARCH_SEED
+    base_seed = seed if seed is not None else random.randrange(2 ** 32)
+
+    progress = None
+    exhaustive_state = None
+    if checkpoint is not None and mode not in ("restart", "exhaustive"):
+        print(f"檢查點只支援 restart 與 exhaustive 模式，{mode} 模式本次不寫入檢查點")
+        checkpoint = None
+    if checkpoint is not None and mode == "exhaustive":
+        courses, teachers = resolve_table(courses, teachers)
+        if resume:
+            exhaustive_state = checkpoint.load("exhaustive", courses, teachers)
+    elif checkpoint is not None:
+        courses, teachers = resolve_table(courses, teachers)
+        workers = workers or config.SEARCH_WORKERS
+        # 單一行程時以檢查點間隔為批次大小，平行時以工作批次為單位
+        chunk_size = checkpoint.interval if workers <= 1 else chunk_size or config.SEARCH_CHUNK_SIZE
+        if resume:
+            progress = SearchProgress.resume(checkpoint, base_seed, chunk_size, courses, teachers)
+        else:
+            progress = SearchProgress(base_seed, chunk_size, courses, teachers, checkpoint)
+        base_seed = progress.base_seed
+
+    if store is not None:
+        courses, teachers = resolve_table(courses, teachers)
+        run_id = None
+        if progress is not None:
+            run_id = progress.run_id
+        elif exhaustive_state is not None:
+            run_id = exhaustive_state.get("run_id")
+        store.start_run(courses, teachers, mode, base_seed, run_id)
+        if progress is not None:
+            progress.run_id = store.run_id
+
+    if mode == "global":
+        best, stats = global_search(courses, teachers, tracer or NULL_TRACER, budget, store)
+    elif mode == "pareto":
+        front, stats = pareto_search(base_seed, budget.max_attempts or config.MAX_ATTEMPTS, courses, teachers,
+                                     tracer or NULL_TRACER, budget, store)
+        best = None
+        for candidate in front:
+            if is_better(candidate, best):
+                best = candidate
+    elif mode == "exhaustive":
+        best, stats = exhaustive_search(courses, teachers, tracer or NULL_TRACER, budget, store,
+                                        checkpoint, exhaustive_state)
+    else:
+        max_attempts = budget.max_attempts or config.MAX_ATTEMPTS
+        workers = workers or config.SEARCH_WORKERS
+        chunk_size = chunk_size or config.SEARCH_CHUNK_SIZE
+
+        if workers <= 1 and progress is not None:
+            best, stats = sequential_search(max_attempts, progress, None, tracer or NULL_TRACER, budget, store)
+        elif workers <= 1:
+            best, stats, _ = search_chunk(base_seed, 0, max_attempts, None, courses, teachers,
+                                          tracer or NULL_TRACER, budget, store)
+        else:
+            best, stats = parallel_search(base_seed, max_attempts, workers, chunk_size,
+                                          courses, teachers, tracer, budget, store, progress)
+    if store is not None:
+        store.flush()
+
+    result = {
+        "solution": best[2] if best is not None else None,
+        "hours_diff": best[0] if best is not None else None,
+        "groups_diff": best[1] if best is not None else None,
+        "attempt": best[3] if best is not None else None,
+        "attempts": stats["attempts"],
+        "elapsed": budget.elapsed(),
+        "budget_exhausted": stats["budget_exhausted"] > 0,
+        "stats": stats,
+    }
+    if store is not None:
+        result["run_id"] = store.run_id
+    if front is not None:
+        result["pareto_front"] = [
+            {"hours_diff": c[0], "groups_diff": c[1], "attempt": c[3], "solution": c[2]} for c in front
+        ]
+    return result
+
+
+def search_best_solution(max_attempts=None, workers=None, seed=None, chunk_size=None, mode=None,
+                         stats=None, courses=None, teachers=None, tracer=None, time_limit=None):
+    """重複兩階段分配並回傳最佳解，workers 大於 1 時以多行程平行搜尋
+
+    若傳入 stats（Counter），會累加各種結果的嘗試次數，例如
+    chinese_math_rejected 即為事後檢查國數規則而浪費的嘗試次數。
+    若傳入 tracer（SearchTracer），會記錄各階段耗時與每次嘗試的結果。
+    time_limit 為整次搜尋的時間上限（秒），未指定時依 config.SEARCH_TIME_LIMIT。
+    courses、teachers 未指定時使用 table.py 中的資料。
+    """
+    budget = SearchBudget(max_attempts or config.MAX_ATTEMPTS,
+                          time_limit if time_limit is not None else config.SEARCH_TIME_LIMIT)
+    result = search_with_budget(budget, workers, seed, chunk_size, mode, courses, teachers, tracer)
+    if stats is not None:
+        stats.update(result["stats"])
+    return result["solution"]
@@ -0,0 +1,60 @@
+# search_checkpoint.py
+import os
+import pickle
+from datetime import datetime
+
+import config
+from candidate_store import course_signature
+
+# 檢查點格式變更時遞增，讓舊檔失效
+CHECKPOINT_VERSION = 1
+
+
+class SearchCheckpoint:
+    """長時間搜尋的檢查點檔
+
+    以 pickle 原子寫入（先寫暫存檔再取代），內容為 kind（"search"、"exhaustive" 或 "grab"）、
+    課表簽章、老師名單與呼叫端提供的搜尋狀態；讀取時種類、課表或老師不同就視為
+    沒有檢查點，避免把另一份課表的進度接續到這一份。
+    """
+
+    def __init__(self, path=None, interval=None):
+        self.path = path or config.CHECKPOINT_PATH
+        self.interval = interval or config.CHECKPOINT_INTERVAL
+        self.saves = 0
+
+    def load(self, kind, courses, teachers):
+        """讀取檢查點，不存在或不符合時回傳 None"""
+        try:
+            with open(self.path, "rb") as f:
+                state = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if (state.get("version") != CHECKPOINT_VERSION or state.get("kind") != kind
+                or state.get("course_signature") != course_signature(courses)
+                or state.get("teachers") != sorted(teachers)):
+            return None
+        return state
+
+    def save(self, kind, courses, teachers, **state):
+        """寫入檢查點"""
+        state.update({
+            "version": CHECKPOINT_VERSION,
+            "kind": kind,
+            "course_signature": course_signature(courses),
+            "teachers": sorted(teachers),
+            "saved_at": datetime.now().isoformat(timespec="seconds"),
+        })
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, self.path)
+        self.saves += 1
+
+    def clear(self):
+        """刪除檢查點檔"""
+        if os.path.exists(self.path):
+            os.remove(self.path)
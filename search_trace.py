@@ -0,0 +1,147 @@
+# search_trace.py
+import json
+from collections import Counter
+from contextlib import contextmanager
+from time import perf_counter
+
+# 搜尋迴圈中計時的階段
+PHASES = ("phase1", "model_build", "solve", "verify", "refine", "score")
+
+
+class SearchTracer:
+    """記錄搜尋迴圈各階段的耗時與每次嘗試的結果
+
+    phase() 累計各階段的耗時，record() 記錄一次嘗試的結果
+    （infeasible、chinese_math_rejected、groups_rejected、exception:<類型>、accepted …），
+    並可寫出 JSON-lines 追蹤檔。平行搜尋時每個工作行程各有一個 tracer，
+    結束後以 merge() 合併回主行程。
+    """
+
+    def __init__(self, trace_path=None, keep_records=False):
+        self.phase_seconds = Counter()
+        self.phase_calls = Counter()
+        self.outcomes = Counter()
+        self.counters = Counter()
+        self.attempts = 0
+        self.trace_path = trace_path
+        self.keep_records = keep_records
+        self.records = []
+        self._trace_file = None
+        self._current = Counter()
+
+    @contextmanager
+    def phase(self, name):
+        """計時一個階段"""
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = perf_counter() - start
+            self.phase_seconds[name] += elapsed
+            self.phase_calls[name] += 1
+            self._current[name] += elapsed
+
+    def count(self, name, n=1):
+        """累加一個事件計數（例如求解快取命中）"""
+        self.counters[name] += n
+
+    def record(self, attempt, outcome, **fields):
+        """記錄一次嘗試的結果與本次各階段耗時"""
+        self.attempts += 1
+        self.outcomes[outcome] += 1
+        entry = {"attempt": attempt, "outcome": outcome}
+        entry.update({f"{name}_ms": round(seconds * 1000, 3) for name, seconds in self._current.items()})
+        entry.update(fields)
+        self._current = Counter()
+        self._write(entry)
+
+    def record_exception(self, attempt, error):
+        """記錄發生例外的嘗試"""
+        self.record(attempt, f"exception:{type(error).__name__}", error=str(error))
+
+    def _write(self, entry):
+        if self.keep_records:
+            self.records.append(entry)
+        if self.trace_path is not None:
+            if self._trace_file is None:
+                self._trace_file = open(self.trace_path, "a", encoding="utf-8")
+            self._trace_file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def merge(self, other):
+        """合併另一個 tracer（例如平行工作行程）的統計與追蹤紀錄"""
+        self.phase_seconds.update(other.phase_seconds)
+        self.phase_calls.update(other.phase_calls)
+        self.outcomes.update(other.outcomes)
+        self.counters.update(other.counters)
+        self.attempts += other.attempts
+        for entry in other.records:
+            self._write(entry)
+
+    def stats(self):
+        """以 Counter 回傳嘗試次數與各種結果的次數"""
+        stats = Counter(self.outcomes)
+        stats["attempts"] = self.attempts
+        return stats
+
+    def summary(self):
+        """回傳可序列化的統計摘要"""
+        return {
+            "attempts": self.attempts,
+            "outcomes": dict(self.outcomes),
+            "counters": dict(self.counters),
+            "phases": {
+                name: {"calls": self.phase_calls[name], "seconds": round(self.phase_seconds[name], 6)}
+                for name in self.phase_seconds
+            },
+        }
+
+    def format_summary(self):
+        """將統計摘要排成文字表格"""
+        total = sum(self.phase_seconds.values()) or 1.0
+        attempts = self.attempts or 1
+        lines = ["階段               次數   總耗時(s)  每次嘗試(ms)    佔比"]
+        names = [p for p in PHASES if p in self.phase_seconds]
+        names += [p for p in self.phase_seconds if p not in PHASES]
+        for name in names:
+            seconds = self.phase_seconds[name]
+            calls = self.phase_calls[name]
+            lines.append(f"{name:<14}{calls:>8}{seconds:>12.3f}{seconds / attempts * 1000:>14.2f}"
+                         f"{seconds / total:>8.1%}")
+        lines.append("")
+        lines.append(f"結果（共 {self.attempts} 次嘗試）")
+        for outcome, count in self.outcomes.most_common():
+            lines.append(f"  {outcome:<28}{count:>6}")
+        for name, count in sorted(self.counters.items()):
+            lines.append(f"  ({name})".ljust(30) + f"{count:>6}")
+        return "\n".join(lines)
+
+    def close(self):
+        if self._trace_file is not None:
+            self._trace_file.close()
+            self._trace_file = None
+
+    def __getstate__(self):
+        # 檔案不跟著序列化（平行工作行程只回傳統計與緩衝的紀錄）
+        state = self.__dict__.copy()
+        state["_trace_file"] = None
+        return state
+
+
+class NullTracer:
+    """不記錄任何東西的 tracer，未啟用追蹤時使用"""
+
+    @contextmanager
+    def phase(self, name):
+        yield
+
+    def count(self, name, n=1):
+        pass
+
+    def record(self, attempt, outcome, **fields):
+        pass
+
+    def record_exception(self, attempt, error):
+        pass
+
+
+NULL_TRACER = NullTracer()
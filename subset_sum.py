@@ -0,0 +1,91 @@
+# subset_sum.py
+# 國數求解前的節數可行性檢查：把尚未分配的國數課程剛好分給每位老師的剩餘節數
+# （多背包／裝箱問題）。只看節數與國數覆蓋，不看衝堂與人次，因此是必要條件：
+# 判定不可行時模型必定無解，判定可行時仍需求解。
+
+# 課程旗標
+CHINESE = 1
+MATH = 2
+
+
+def suffix_tables(items):
+    """依節數由大到小排序課程，並計算每個位置之後的子集合和 bitset 與國語、數學課數
+
+    items 為 [(節數, 旗標), ...]；回傳 (排序後的課程, reach, chinese, math)，
+    reach[k] 的第 s 個位元為 1 表示第 k 堂之後的課程可湊出 s 節。
+    """
+    items = sorted(items, key=lambda item: -item[0])
+    n = len(items)
+    reach = [0] * (n + 1)
+    chinese = [0] * (n + 1)
+    math = [0] * (n + 1)
+    reach[n] = 1
+    for k in range(n - 1, -1, -1):
+        periods, flag = items[k]
+        reach[k] = reach[k + 1] | (reach[k + 1] << periods)
+        chinese[k] = chinese[k + 1] + (flag == CHINESE)
+        math[k] = math[k + 1] + (flag == MATH)
+    return items, reach, chinese, math
+
+
+def can_partition(tables, bins, node_limit=None):
+    """判斷課程能否剛好分進各個容量，且每個需要國語／數學的容量都分到該科
+
+    tables 為 suffix_tables() 的結果，bins 為 [(剩餘節數, 需要的旗標), ...]。
+    由大到小逐堂放入，每一步先以 bitset 檢查每個容量仍能被剩下的課程湊出、
+    剩下的國語與數學課數足夠，相同狀態（容量排序後）只展開一次。
+    回傳 True／False；展開次數超過 node_limit 時回傳 None（無法判定）。
+    """
+    items, reach, chinese, math = tables
+    n = len(items)
+    if sum(periods for periods, _ in items) != sum(capacity for capacity, _ in bins):
+        return False
+
+    state = [[capacity, need] for capacity, need in bins]
+    failed = set()
+    nodes = 0
+
+    class Inconclusive(Exception):
+        pass
+
+    def search(k):
+        nonlocal nodes
+        nodes += 1
+        if node_limit is not None and nodes > node_limit:
+            raise Inconclusive
+
+        need_chinese = need_math = 0
+        for capacity, need in state:
+            if capacity < 0 or not (reach[k] >> capacity) & 1 or (need and capacity == 0):
+                return False
+            need_chinese += need & CHINESE
+            need_math += need >> 1
+        if k == n:
+            return True
+        if need_chinese > chinese[k] or need_math > math[k]:
+            return False
+
+        key = (k, tuple(sorted(map(tuple, state))))
+        if key in failed:
+            return False
+
+        periods, flag = items[k]
+        tried = set()
+        for slot in state:
+            # 容量與需求相同的老師可互換，只試一次
+            signature = (slot[0], slot[1])
+            if slot[0] < periods or signature in tried:
+                continue
+            tried.add(signature)
+            slot[0] -= periods
+            slot[1] &= ~flag
+            if search(k + 1):
+                return True
+            slot[0], slot[1] = signature
+        failed.add(key)
+        return False
+
+    try:
+        return search(0)
+    except Inconclusive:
+        return None
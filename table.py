@@ -1,6 +1,10 @@
 import random
 from collections import defaultdict
-from typing import List, Dict, Any, Tuple
+from itertools import permutations, product
+from math import factorial
+from typing import List, Dict, Any, Tuple, Iterator
+from course_table import as_course_table
+from teacher_load import TeacherLoad, as_teacher_load
 
 courses = [
     {"年級": 1, "課程名稱": "國語", "組別": "A", "節數": 2, "人數": 4, "人次": 8},
@@ -41,58 +45,195 @@ courses = [
 teachers = ["A老師", "B老師", "C老師", "D老師", "E老師"]
 
 
-def allocate_courses(courses: List[Dict[str, Any]], teachers: List[str]) -> Dict[str, Dict]:
-    teacher_loads = defaultdict(lambda: {"節數": 0, "人次": 0, "課程": []})
+def find_special_courses(courses: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """找出需先行平均分配給不同老師的特定 5 堂課"""
+    table = as_course_table(courses)
+    return [
+        table.find("社會", 4, "E"),
+        table.find("社會", 5, "F"),
+        table.find("社會", 5, "G"),
+        table.find("社會", 2, "C"),
+        table.find("動作", 2, "B"),
+    ]
+
+
+def make_rng(rng=None):
+    """取得亂數產生器：None 為全域 random 模組，整數為以其為種子的新 random.Random"""
+    if rng is None:
+        return random
+    if isinstance(rng, random.Random):
+        return rng
+    return random.Random(rng)
+
+
+def allocate_courses(courses: List[Dict[str, Any]], teachers: List[str], rng=None,
+                     loads: Dict[str, TeacherLoad] = None) -> Dict[str, Dict]:
+    """隨機分配特需課程（社會、動作、學習）
+
+    rng 可為 random.Random 或整數種子，相同種子得到相同的分配；未指定時使用全域 random 模組。
+    不會修改傳入的課程與老師名單，因此可在多個執行緒或工作行程中同時呼叫。
+    傳入 loads（{老師: TeacherLoad}）時會清空後直接寫入並回傳，讓重複嘗試時可重複使用同一組負載。
+    """
+    rng = make_rng(rng)
+    if loads is None:
+        teacher_loads = {t: TeacherLoad() for t in teachers}
+    else:
+        teacher_loads = loads
+        for t in teachers:
+            teacher_loads.setdefault(t, TeacherLoad()).reset()
 
     def assign_course(teacher: str, course: Dict[str, Any]):
-        teacher_loads[teacher]["課程"].append(course)
-        teacher_loads[teacher]["節數"] += course["節數"]
-        teacher_loads[teacher]["人次"] += course["人次"]
+        teacher_loads[teacher].add(course)
 
     # 分類課程
-    social_courses = [c for c in courses if c["課程名稱"] == "社會"]
-    action_courses = [c for c in courses if c["課程名稱"] == "動作"]
-    study_courses = [c for c in courses if c["課程名稱"] == "學習"]
+    table = as_course_table(courses)
+    social_courses = table.of_subject("社會")
+    action_courses = table.of_subject("動作")
+    study_courses = table.of_subject("學習")
 
     # 檢查基本課數
     if len(social_courses) != 9 or len(study_courses) != 2:
         raise ValueError("社會課應為9堂，學習課應為2堂")
 
     # 先行平均分配特定 5 堂課
-    special = [
-        next(c for c in courses if c["課程名稱"] == "社會" and c["年級"] == 4 and c["組別"] == "E"),
-        next(c for c in courses if c["課程名稱"] == "社會" and c["年級"] == 5 and c["組別"] == "F"),
-        next(c for c in courses if c["課程名稱"] == "社會" and c["年級"] == 5 and c["組別"] == "G"),
-        next(c for c in courses if c["課程名稱"] == "社會" and c["年級"] == 2 and c["組別"] == "C"),
-        next(c for c in courses if c["課程名稱"] == "動作" and c["年級"] == 2 and c["組別"] == "B"),
-    ]
-    # 隨機打亂老師順序，平均分配
-    random.shuffle(teachers)
+    special = find_special_courses(table)
+    special_ids = set(table.course_id(c) for c in special)
+    # 隨機打亂老師順序（複本，不修改呼叫端的名單），平均分配
+    teachers = list(teachers)
+    rng.shuffle(teachers)
     for teacher, course in zip(teachers, special):
         assign_course(teacher, course)
     # 從課程列表中移除
-    social_courses = [c for c in social_courses if c not in special]
-    action_courses = [c for c in action_courses if c not in special]
+    social_courses = [c for c in social_courses if table.course_id(c) not in special_ids]
+    action_courses = [c for c in action_courses if table.course_id(c) not in special_ids]
 
     # 隨機打散剩餘社會課並 round-robin 分配
-    random.shuffle(social_courses)
+    rng.shuffle(social_courses)
     for idx, course in enumerate(social_courses):
         t = teachers[idx % len(teachers)]
         assign_course(t, course)
 
     # 分配學習課
-    random.shuffle(study_courses)
+    rng.shuffle(study_courses)
     # 學習課可自由分配，但確保第一位老師多一門
     assign_course(teachers[0], study_courses[0])
-    assign_course(random.choice(teachers), study_courses[1])
+    assign_course(rng.choice(teachers), study_courses[1])
 
     # 分配剩餘動作課
     for course in action_courses:
-        assign_course(random.choice(teachers), course)
+        assign_course(rng.choice(teachers), course)
 
     return teacher_loads
 
 
+def _allocation_plans(courses: List[Dict[str, Any]], teachers: List[str]):
+    """enumerate_allocations 與 count_allocations 共用的列舉計畫
+
+    回傳 (特定課程, 剩餘社會課, 學習課, 剩餘動作課, 計畫列表)，
+    計畫為 (每位老師再拿幾堂社會課, 學習課的老師選法, 動作課的老師選法)。
+    """
+    table = as_course_table(courses)
+    social_courses = table.of_subject("社會")
+    action_courses = table.of_subject("動作")
+    study_courses = table.of_subject("學習")
+
+    # 檢查基本課數
+    if len(social_courses) != 9 or len(study_courses) != 2:
+        raise ValueError("社會課應為9堂，學習課應為2堂")
+
+    special = find_special_courses(table)
+    special_ids = set(table.course_id(c) for c in special)
+    social_courses = [c for c in social_courses if table.course_id(c) not in special_ids]
+    action_courses = [c for c in action_courses if table.course_id(c) not in special_ids]
+    if len(teachers) != len(special):
+        raise ValueError("特定課程的數量必須等於老師人數")
+
+    base_social = [int(c["課程名稱"] == "社會") for c in special]
+    base_action = [int(c["課程名稱"] == "動作") for c in special]
+    teacher_range = range(len(teachers))
+
+    # 每位老師再拿幾堂剩餘社會課，使社會課總數為 1 或 2
+    social_splits = [
+        counts for counts in product(*[[r for r in (0, 1, 2) if base_social[k] + r in (1, 2)]
+                                       for k in teacher_range])
+        if sum(counts) == len(social_courses)
+    ]
+
+    plans = []
+    for counts in social_splits:
+        one_social = [k for k in teacher_range if base_social[k] + counts[k] == 1]
+        # 學習課：每位老師至多 1 堂，只有 1 堂社會課的老師必須恰好 1 堂
+        study_choices = [
+            choice for choice in permutations(teacher_range, len(study_courses))
+            if all(k in choice for k in one_social)
+        ]
+        # 動作課：只有 1 堂社會課的老師動作課必須恰好 1 堂
+        action_choices = [
+            choice for choice in product(teacher_range, repeat=len(action_courses))
+            if all(base_action[k] + choice.count(k) == 1 for k in one_social)
+        ]
+        if study_choices and action_choices:
+            plans.append((counts, study_choices, action_choices))
+    return special, social_courses, study_courses, action_courses, plans
+
+
+def enumerate_allocations(courses: List[Dict[str, Any]], teachers: List[str]) -> Iterator[Dict[str, Dict]]:
+    """逐一列出所有通過 verify_allocation 且特定 5 堂課分給不同老師的特需課程分配
+
+    老師彼此可互換，因此固定第 k 位老師拿第 k 堂特定課程來消除對稱：
+    任何合法分配都恰好對應到一種這樣的排列，只差老師順序的分配只會出現一次。
+    其餘課程依 verify_allocation 的規則列舉：每位老師社會課 1 或 2 堂、
+    只有 1 堂社會課的老師動作與學習課各恰好 1 堂、沒有老師超過 1 堂學習課。
+    """
+    special, social_courses, study_courses, action_courses, plans = _allocation_plans(courses, teachers)
+    teacher_range = range(len(teachers))
+
+    for counts, study_choices, action_choices in plans:
+        for social_choice in _distribute(len(social_courses), counts):
+            for study_choice in study_choices:
+                for action_choice in action_choices:
+                    teacher_loads = defaultdict(TeacherLoad)
+
+                    def assign_course(k: int, course: Dict[str, Any]):
+                        teacher_loads[teachers[k]].add(course)
+
+                    for k in teacher_range:
+                        assign_course(k, special[k])
+                    for k, course in zip(social_choice, social_courses):
+                        assign_course(k, course)
+                    for k, course in zip(study_choice, study_courses):
+                        assign_course(k, course)
+                    for k, course in zip(action_choice, action_courses):
+                        assign_course(k, course)
+
+                    yield teacher_loads
+
+
+def count_allocations(courses: List[Dict[str, Any]], teachers: List[str]) -> int:
+    """enumerate_allocations 會列出的分配數，不實際列舉"""
+    _, social_courses, _, _, plans = _allocation_plans(courses, teachers)
+    total = 0
+    for counts, study_choices, action_choices in plans:
+        # 把剩餘社會課分給各老師（第 k 位 counts[k] 堂）的方式數為多項式係數
+        ways = factorial(len(social_courses))
+        for count in counts:
+            ways //= factorial(count)
+        total += ways * len(study_choices) * len(action_choices)
+    return total
+
+
+def _distribute(n: int, counts: Tuple[int, ...]) -> Iterator[Tuple[int, ...]]:
+    """列出把 n 堂不同的課分給各老師（第 k 位恰好 counts[k] 堂）的所有方式，回傳每堂課的老師位置"""
+    if n == 0:
+        yield ()
+        return
+    for k, count in enumerate(counts):
+        if count:
+            rest = counts[:k] + (count - 1,) + counts[k + 1:]
+            for choice in _distribute(n - 1, rest):
+                yield (k,) + choice
+
+
 ##0608早版
 # def allocate_courses(courses: List[Dict[str, Any]], teachers: List[str]) -> Dict[str, Dict]:
 #     from collections import defaultdict
@@ -298,10 +439,11 @@ def allocate_courses(courses: List[Dict[str, Any]], teachers: List[str]) -> Dict
 def verify_allocation(teacher_loads: Dict[str, Dict]) -> Tuple[bool, str]:
     """驗證分配是否符合所有規則"""
     for teacher, load in teacher_loads.items():
-        # 計算每種課程的數量
-        social_count = sum(1 for c in load["課程"] if c["課程名稱"] == "社會")
-        action_count = sum(1 for c in load["課程"] if c["課程名稱"] == "動作")
-        study_count = sum(1 for c in load["課程"] if c["課程名稱"] == "學習")
+        # 計算每種課程的數量（TeacherLoad 已即時維護）
+        load = as_teacher_load(load)
+        social_count = load.count("社會")
+        action_count = load.count("動作")
+        study_count = load.count("學習")
         
         # 檢查是否有老師只有1堂社會課
         if social_count == 1:
@@ -0,0 +1,89 @@
+# teacher_load.py
+from collections import Counter
+from typing import Dict, Any
+from config import BASIC_SUBJECTS, MAIN_SUBJECTS
+
+
+class TeacherLoad(dict):
+    """老師負載
+
+    保留原本 {"節數", "人次", "課程"} 的 dict 介面，另外在每次 add/remove
+    時即時維護各科課程數與國數備課組別（科目 + 年級），
+    讓驗證與備課組別計算不必重新掃描課程列表。
+    """
+
+    def __init__(self):
+        super().__init__({"節數": 0, "人次": 0, "課程": []})
+        self.subject_counts = Counter()
+        self.prep_groups = Counter()
+
+    def add(self, course: Dict[str, Any]):
+        """分配一堂課給這位老師"""
+        self["課程"].append(course)
+        self["節數"] += course["節數"]
+        self["人次"] += course["人次"]
+        self.subject_counts[course["課程名稱"]] += 1
+        if course["課程名稱"] in MAIN_SUBJECTS:
+            self.prep_groups[(course["課程名稱"], course["年級"])] += 1
+
+    def remove(self, course: Dict[str, Any]):
+        """從這位老師移除一堂課"""
+        self["課程"].remove(course)
+        self["節數"] -= course["節數"]
+        self["人次"] -= course["人次"]
+        self.subject_counts[course["課程名稱"]] -= 1
+        if course["課程名稱"] in MAIN_SUBJECTS:
+            key = (course["課程名稱"], course["年級"])
+            self.prep_groups[key] -= 1
+            if self.prep_groups[key] == 0:
+                del self.prep_groups[key]
+
+    def reset(self):
+        """清空負載以便重複使用（課程列表就地清空）"""
+        self["節數"] = 0
+        self["人次"] = 0
+        self["課程"].clear()
+        self.subject_counts.clear()
+        self.prep_groups.clear()
+
+    def copy(self) -> "TeacherLoad":
+        """複製一份負載（課程列表與計數各自獨立）"""
+        copied = TeacherLoad()
+        copied["節數"] = self["節數"]
+        copied["人次"] = self["人次"]
+        copied["課程"] = list(self["課程"])
+        copied.subject_counts = self.subject_counts.copy()
+        copied.prep_groups = self.prep_groups.copy()
+        return copied
+
+    def count(self, subject: str) -> int:
+        """某科目的課程數"""
+        return self.subject_counts[subject]
+
+    @property
+    def basic_prep_groups(self) -> int:
+        """特需課程的備課組別數（每一門課各算一組）"""
+        return sum(self.subject_counts[s] for s in BASIC_SUBJECTS)
+
+    @property
+    def chinese_math_prep_groups(self) -> int:
+        """國數的備課組別數（同科目同年級合併計算）"""
+        return len(self.prep_groups)
+
+    @property
+    def has_chinese(self) -> bool:
+        return self.subject_counts["國語"] > 0
+
+    @property
+    def has_math(self) -> bool:
+        return self.subject_counts["數學"] > 0
+
+
+def as_teacher_load(load) -> TeacherLoad:
+    """將舊格式的負載 dict 轉為 TeacherLoad（已是 TeacherLoad 時直接回傳）"""
+    if isinstance(load, TeacherLoad):
+        return load
+    converted = TeacherLoad()
+    for course in load["課程"]:
+        converted.add(course)
+    return converted